@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+""" Benchmarks the stages of the markdown documentation pipeline against a synthetic schema
+    set, in isolation and end-to-end, recording wall time and peak memory for each stage.
+    Results can be saved as a baseline and later runs compared against it, so scaling
+    regressions in generate_markdown_schema.py are caught before they reach the doc builds.
+"""
+import io
+import os
+import sys
+import json
+import time
+import yaml
+import shutil
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+
+from contextlib import redirect_stdout
+
+import generate_markdown_schema as gms
+
+DESCRIPTION = "Synthetic schema used to benchmark the documentation pipeline."
+BASE_URI = "https://schemas.example.org/schema"
+
+def get_cli_arguments():
+    """ Parse command line arguments and return an object whose members contain the argument values. """
+    parser = argparse.ArgumentParser(description="Benchmark the markdown documentation pipeline")
+    parser.add_argument('--fragments', dest='fragments', type=int, default=200, help='Number of YAML fragments in the synthetic schema')
+    parser.add_argument('--properties', dest='properties', type=int, default=50, help='Number of top-level properties')
+    parser.add_argument('--fan-out', dest='fan_out', type=int, default=3, help='Number of $refs in each non-leaf fragment')
+    parser.add_argument('--depth', dest='depth', type=int, default=3, help='Nesting depth of $refs below the top-level properties')
+    parser.add_argument('--notes-lines', dest='notes_lines', type=int, default=20, help='Number of lines in each usageNotes element')
+    parser.add_argument('--lines', dest='lines', type=int, default=120000, help='Approximate number of markdown lines in the largest post-processing scaling run')
+    parser.add_argument('--max-ratio', dest='max_ratio', type=float, default=2.0, help='Largest allowed growth in per-line post-processing cost between the smallest and largest run')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3, help='Number of timed runs per stage; the fastest is reported')
+    parser.add_argument('--output', dest='output', type=str, help='Write the results to this JSON file (e.g. to save a baseline)')
+    parser.add_argument('--baseline', dest='baseline', type=str, help='Compare the results against a previously saved JSON file')
+    parser.add_argument('--tolerance', dest='tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline, as a fraction')
+    return parser.parse_args()
+
+def fragment_id(index):
+    return f"{BASE_URI}/yaml/fragment_{index}?version=v1"
+
+def usage_notes(name, lines):
+    return ''.join(f"Line {i} of the usage notes for {name}, long enough to wrap in the rendered markdown.\n" for i in range(lines))
+
+def write_synthetic_schema(root_dir, fragments, properties, fan_out, depth, notes_lines):
+    """ Writes a synthetic top-level schema and its YAML fragments under root_dir/schema. The
+        fragments are split into depth levels; each fragment above the last level is an object
+        whose fields $ref fan_out fragments of the next level, so fragments are shared.
+    """
+    yaml_dir = os.path.join(root_dir, 'schema', 'yaml')
+    os.makedirs(yaml_dir, exist_ok=True)
+
+    depth = max(1, min(depth, fragments))
+    levels = [list(range(level, fragments, depth)) for level in range(depth)]
+    for level, indexes in enumerate(levels):
+        for position, index in enumerate(indexes):
+            content = {'$schema': 'https://json-schema.org/draft-07/schema#', '$id': fragment_id(index), 'usageNotes': usage_notes(f"fragment {index}", notes_lines)}
+            if level + 1 < depth:
+                children = levels[level + 1]
+                content['type'] = 'object'
+                content['additionalProperties'] = False
+                content['properties'] = {f"field_{k}": {'description': f"Field {k} of fragment {index}.", '$ref': fragment_id(children[(position * fan_out + k) % len(children)])} for k in range(fan_out)}
+            else:
+                content['type'] = 'string'
+                content['controlledVocab'] = 'N/A'
+            with open(os.path.join(yaml_dir, f"fragment_{index}.yaml"), 'w', encoding='utf-8') as f:
+                yaml.safe_dump(content, f, sort_keys=False)
+
+    #alternate between arrays of objects and plain references to the top level of fragments
+    schema = {'$schema': 'https://json-schema.org/draft-07/schema#', '$id': f"{BASE_URI}/icpsr_study_schema?version=v1", 'title': 'Synthetic Schema',
+              'description': DESCRIPTION, 'type': 'object', 'required': [], 'additionalProperties': False, 'properties': {}}
+    for i in range(properties):
+        ref = fragment_id(levels[0][i % len(levels[0])])
+        if i % 2:
+            prop = {'description': f"Property {i}.", 'type': 'array', 'items': {'$ref': ref}}
+        else:
+            prop = {'description': f"Property {i}.", '$ref': ref, 'examples': [f"example {i}"]}
+            schema['required'].append(f"property_{i}")
+        schema['properties'][f"property_{i}"] = prop
+
+    with open(os.path.join(root_dir, 'schema', 'icpsr_study_schema.json'), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=2)
+
+    #the end-to-end build needs the templates and key alongside the schema
+    resource_dir = os.path.dirname(os.path.abspath(__file__))
+    shutil.copytree(os.path.join(resource_dir, 'template'), os.path.join(root_dir, 'resources', 'template'))
+    shutil.copy(os.path.join(resource_dir, 'key.md'), os.path.join(root_dir, 'resources', 'key.md'))
+
+def synthetic_markdown(line_count):
+    """ Returns a list of lines shaped like the generator's markdown output, with roughly line_count lines. """
+    section_length = 27
+    prop_count = max(1, line_count // section_length)
+
+    content = ["# Synthetic Schema\n", "\n", f"{DESCRIPTION}\n", "\n"]
+    content.append("| Property | Required? | Repeatable? | Type | Description |\n")
+    content.append("| --- | --- | --- | --- | --- |\n")
+    for i in range(prop_count):
+        content.append(f"| [prop_{i}](#prop_{i} ) | Yes | No | string | Synthetic property {i}. |\n")
+    content.append("\n")
+
+    for i in range(prop_count):
+        content.extend([
+            f'## <a name="prop_{i}"></a>{i + 1}. prop_{i}         [required]\n', "\n",
+            f"**Description:** Synthetic property {i}.\n", "\n",
+            "**Type**: `string`\n", "\n",
+            "**Format**: `date`\n", "\n",
+            "**Controlled Vocabulary:** N/A\n", "\n",
+            "**Examples:** \n", "\n",
+            "```json\n", '"2001-02-07"\n', "```\n", "\n",
+            "**Type**: `array of string`\n", "\n",
+            f'### <a name="autogenerated_heading_{i}"></a>{i + 1}.1. prop_{i} items\n', "\n",
+            "**Type**: `string`\n", "\n",
+            '**Additional properties**: [[Not allowed]](# "Additional Properties not allowed.")\n', "\n", "\n",
+        ])
+    return content
+
+def measure(stage, repeat):
+    """ Runs stage() repeat times and once more under tracemalloc. Returns the fastest wall
+        time in seconds, the peak traced memory in MB and the last result.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak / 2**20, result
+
+def quietly(function, *args):
+    """ Calls function with its progress messages suppressed. """
+    with redirect_stdout(io.StringIO()):
+        return function(*args)
+
+def benchmark_stages(root_dir, repeat):
+    """ Times each pipeline stage in isolation on the schema set in root_dir, then a full build. """
+    results = {}
+    resource_dir = os.path.join(root_dir, 'resources')
+    template_file = os.path.join(resource_dir, 'template', 'base.md')
+    temp_dir = os.path.join(root_dir, 'temp')
+    metadata_key = os.path.join(resource_dir, 'key.md')
+
+    def record(name, stage):
+        seconds, peak_mb, result = measure(stage, repeat)
+        results[name] = {'seconds': seconds, 'peak_mb': peak_mb}
+        print(f"\t{name:<28} {seconds:9.4f}s  {peak_mb:9.2f} MB")
+        return result
+
+    raw_cache = record('load_cache', lambda: gms.load_cache(root_dir, workers=1))
+    #below the threshold load_cache parses serially whatever the number of workers
+    parallel = len(gms.get_schema_files(root_dir)) >= gms.PARALLEL_PARSE_THRESHOLD
+    record('load_cache (parallel)' if parallel else 'load_cache (below threshold)', lambda: gms.load_cache(root_dir, workers=os.cpu_count()))
+    cache = record('dereference_cache', lambda: gms.dereference_cache(dict(raw_cache), share=True))
+    record('persist_cache', lambda: gms.persist_cache(cache, temp_dir))
+    schema = list(gms.get_top_level_schemas(cache).values())[-1]
+
+    try:
+        markdown = record('render', lambda: gms.render_schema_markdown(schema, template_file, os.path.join(temp_dir, 'icpsr_study_schema.json')))
+    except ImportError:
+        print("\tJSON Schema for Humans is not installed; skipping the render and end-to-end stages")
+        return results
+
+    record('post_process', lambda: gms.post_process_markdown(io.StringIO(markdown), io.StringIO(), DESCRIPTION, metadata_key, datetime.datetime.now()))
+
+    args = gms.get_cli_arguments(['--source-dir', root_dir, '--force', '--no-parse-cache'])
+    record('end_to_end', lambda: quietly(gms.build, args))
+    return results
+
+def benchmark_post_process_scaling(lines, metadata_key):
+    """ Times the post-processor on synthetic markdown of increasing size. Per-line cost should
+        stay flat if it scales linearly. Returns the ratio of the largest to smallest per-line cost.
+    """
+    per_line = []
+    for divisor in (8, 4, 2, 1):
+        content = synthetic_markdown(lines // divisor)
+        start = time.perf_counter()
+        gms.post_process_markdown(content, io.StringIO(), DESCRIPTION, metadata_key, datetime.datetime.now())
+        elapsed = time.perf_counter() - start
+        per_line.append(elapsed / len(content))
+        print(f"\tpost_process_markdown: {len(content):>8} lines in {elapsed:.3f}s ({per_line[-1] * 1e6:.2f} us/line)")
+
+    ratio = per_line[-1] / per_line[0]
+    print(f"\tPer-line cost ratio (largest/smallest): {ratio:.2f}")
+    return ratio
+
+def compare_to_baseline(results, baseline, tolerance):
+    """ Prints each stage's change against the baseline and returns the stages that slowed down by more than tolerance. """
+    regressions = []
+    for name, result in results.items():
+        if not baseline.get(name, {}).get('seconds'):
+            continue
+        change = result['seconds'] / baseline[name]['seconds'] - 1
+        print(f"\t{name:<28} {change:+8.1%}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+def main():
+    """ Main entrypoint. """
+    args = get_cli_arguments()
+    metadata_key = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'key.md')
+    failed = False
+
+    root_dir = tempfile.mkdtemp(prefix='schema_benchmark_')
+    try:
+        print(f"Synthetic schema: {args.fragments} fragments, {args.properties} properties, fan-out {args.fan_out}, depth {args.depth}")
+        write_synthetic_schema(root_dir, args.fragments, args.properties, args.fan_out, args.depth, args.notes_lines)
+        results = benchmark_stages(root_dir, args.repeat)
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+    print("Post-processing scaling:")
+    ratio = benchmark_post_process_scaling(args.lines, metadata_key)
+    if ratio > args.max_ratio:
+        print(f"Post-processing does not scale linearly (ratio {ratio:.2f} > {args.max_ratio})")
+        failed = True
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("Change against baseline:")
+        if regressions := compare_to_baseline(results, baseline, args.tolerance):
+            print(f"Stages slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
@@ -7,6 +7,7 @@
     2. Every YAML file has a $schema element identifying the file as a JSON Schema.
     3. Every YAML file has an $id element that can serve as the target of any $ref.
 """
+import io
 import os
 import sys
 import json
@@ -17,148 +18,464 @@ import subprocess
 import datetime
 import shutil
 import re
-
+import copy
+import time
+import pickle
+import threading
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from glob import glob
 from urllib.parse import urlparse, parse_qs
 
+import run_mkdocs
+from instrumentation import Profiler
+from property_index import build_property_index, clean_label
+from incremental_build import (get_commit_date, get_document_dependencies, get_property_dependencies, hash_file, hash_files, load_manifest, relative_path,
+                               save_manifest, splice_sections, stub_property, write_if_changed)
+
+#use libyaml's C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+#filesystem events for watch mode are optional; without watchdog the sources are polled
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+
+#stages that --profile-stage can run under cProfile
+PROFILE_STAGES = ('check_manifest', 'load_cache', 'dereference_cache', 'persist_cache', 'render', 'post_process') + run_mkdocs.PROFILE_STAGES
+
+#the JSON Schema link in each document points at the schema file in the repository
+SCHEMA_URL = 'https://github.com/TEST/metadata/blob/main/{}'
+
+#below this many files, starting a worker pool costs more than it saves
+PARALLEL_PARSE_THRESHOLD = 64
+
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
 log = logging.getLogger()
 
-def get_cli_arguments():
-    """ Parse command line arguments and return an object whose members contain the argument values. """
+def get_cli_arguments(argv=None):
+    """ Parse command line arguments (or argv, if given) and return an object whose members contain the argument values. """
     parser = argparse.ArgumentParser(description="Generate markdown from JSON Schema and YAML files")
     parser.add_argument('--source-dir', dest='source_dir', type=str, help='Source directory', required=True)
-    return parser.parse_args()
+    parser.add_argument('--external-generator', dest='external_generator', action='store_true', help='Run the generate-schema-doc command instead of rendering in-process')
+    parser.add_argument('--workers', dest='workers', type=int, default=None, help='Number of workers used to parse schema files')
+    parser.add_argument('--parse-timings', dest='parse_timings', action='store_true', help='Report how long each schema file took to parse')
+    parser.add_argument('--no-parse-cache', dest='no_parse_cache', action='store_true', help='Parse every schema file instead of reusing the on-disk parse cache')
+    parser.add_argument('--clear-parse-cache', dest='clear_parse_cache', action='store_true', help='Delete the on-disk parse cache before building')
+    parser.add_argument('--watch', dest='watch', action='store_true', help='Keep running and rebuild whenever a schema file or template changes')
+    parser.add_argument('--html', dest='html', action='store_true', help='Also build the HTML site with run_mkdocs.py after each build, unless its inputs are unchanged')
+    parser.add_argument('--force', dest='force', action='store_true', help='Rebuild everything, ignoring the build manifest')
+    parser.add_argument('--keep-temp', dest='keep_temp', action='store_true', help='Keep the dereferenced schema in the temp folder')
+    parser.add_argument('--date-from', dest='date_from', choices=('today', 'sources'), default='today', help="Date shown as 'Last updated': today, or when the schema files of each document last changed, so an unchanged schema gives identical output")
+    parser.add_argument('--profile', dest='profile', action='store_true', help='Record per-stage time, memory and counts, print them and save them as a JSON report')
+    parser.add_argument('--profile-report', dest='profile_report', type=str, help='Where to save the JSON report (default: .cache/profile/generate_markdown_schema.json); implies --profile')
+    parser.add_argument('--profile-stage', dest='profile_stage', choices=PROFILE_STAGES, help='Also run this stage under cProfile, saving the stats next to the report; implies --profile')
+    return parser.parse_args(argv)
+
+def get_schema_files(root_dir):
+    """ Returns the JSON Schema and YAML files under root_dir's schema folder, in a stable order. """
+    schema_files = sorted(glob(os.path.join(root_dir, 'schema', '*.json'), recursive=True))
+    yaml_files  = sorted(glob(os.path.join(root_dir, 'schema', 'yaml', '*.yaml'), recursive=True))
+    return schema_files + yaml_files
+
+def get_template_files(resource_dir):
+    """ Returns the templates, resources and scripts that shape the generated markdown. """
+    scripts = [os.path.join(resource_dir, name) for name in ('generate_markdown_schema.py', 'incremental_build.py', 'property_index.py', 'key.md')]
+    return scripts + glob(os.path.join(resource_dir, 'template', '*.md'))
+
+def parse_schema_file(file_name):
+    """ Parses a JSON or YAML schema file, normalising line breaks in its notes for markdown.
+        Returns the file name, the parsed content and the time taken to parse it.
+    """
+    start = time.perf_counter()
+    #parse from the file object, so parse errors name the file
+    with open(file_name, "r", encoding="utf-8") as f:
+        if ".json" in file_name:
+            content = json.load(f)
+        elif ".yaml" in file_name:
+            content = yaml.load(f, Loader=YamlLoader)
+            if content.get('usageNotes'):
+                content['usageNotes'] = content['usageNotes'].replace('\n', '  \n')
+            if content.get('curatorNotes'):
+                content['curatorNotes'] = content['curatorNotes'].replace('\n', '  \n')
+    return file_name, content, time.perf_counter() - start
+
+def parse_schema_files(file_names, workers=None):
+    """ Parses file_names, in parallel when there are enough of them to be worth it, and yields
+        the results of parse_schema_file in the order of file_names.
+
+        Even with libyaml, only scanning and parsing are done in C; building the Python objects
+        is done by the pure Python SafeConstructor while holding the GIL, so threads would not
+        parse in parallel and separate processes are used instead.
+    """
+    if len(file_names) < PARALLEL_PARSE_THRESHOLD or workers == 1:
+        yield from map(parse_schema_file, file_names)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(parse_schema_file, file_names, chunksize=16)
+
+class ParsedSchemaCache:
+    """ On-disk cache of parsed and normalised schema files, keyed by path. An entry is reused
+        while the file's mtime and size are unchanged, or, failing that, while its content hash
+        still matches.
+    """
+    #bump when parse_schema_file's normalisation changes, to discard stale entries
+    VERSION = 1
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        try:
+            with open(file_name, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == self.VERSION:
+                self._entries = data['entries']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+            pass
 
-def load_cache(root_dir):
+    def lookup(self, file_name):
+        """ Returns the cached content for file_name, or None if it must be parsed again. """
+        stat = os.stat(file_name)
+        entry = self._entries.get(os.path.abspath(file_name))
+        if entry and (entry['mtime'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+            self.hits += 1
+            return entry['content']
+        if entry and entry['hash'] == hash_file(file_name):
+            entry['mtime'], entry['size'] = stat.st_mtime_ns, stat.st_size
+            self.hits += 1
+            return entry['content']
+        self.misses += 1
+        return None
+
+    def store(self, file_name, content):
+        stat = os.stat(file_name)
+        self._entries[os.path.abspath(file_name)] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': hash_file(file_name), 'content': content}
+
+    def save(self, file_names):
+        """ Writes the cache to disk, keeping only entries for file_names. """
+        keep = {os.path.abspath(file_name) for file_name in file_names}
+        entries = {key: entry for key, entry in self._entries.items() if key in keep}
+        os.makedirs(os.path.dirname(self.file_name), exist_ok=True)
+        with open(f"{self.file_name}.tmp", 'wb') as f:
+            pickle.dump({'version': self.VERSION, 'entries': entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{self.file_name}.tmp", self.file_name)
+
+def load_cache(root_dir, sources=None, timings=None, workers=None, parsed_cache=None):
     """ Walks the file system from root_dir and loads any RDE schema files into a dict
-        keyed by the $id of the schema.
+        keyed by the $id of the schema. If a sources dict is given, the file each $id was
+        loaded from is recorded in it; if a timings dict is given, each file's parse time is.
+        Files found unchanged in parsed_cache (a ParsedSchemaCache) are not parsed again.
     """
-    cache = {} 
-    schema_files = glob(os.path.join(root_dir, 'schema', '*.json'), recursive=True)
-    yaml_files  = glob(os.path.join(root_dir, 'schema', 'yaml', '*.yaml'), recursive=True)
+    file_names = get_schema_files(root_dir)
+    parsed = {}
+    if parsed_cache is not None:
+        for file_name in file_names:
+            if (content := parsed_cache.lookup(file_name)) is not None:
+                parsed[file_name] = content
+
+    for file_name, content, elapsed in parse_schema_files([name for name in file_names if name not in parsed], workers):
+        parsed[file_name] = content
+        if timings is not None:
+            timings[file_name] = elapsed
+        if parsed_cache is not None:
+            parsed_cache.store(file_name, content)
+
+    if parsed_cache is not None:
+        parsed_cache.save(file_names)
 
-    for file_name in schema_files + yaml_files:
+    cache = {} 
+    for file_name in file_names:
+        content = parsed[file_name]
         try:
-            with open(file_name, "r", encoding="utf-8") as f:
-                if ".json" in file_name:
-                    content = json.load(f)
-                elif ".yaml" in file_name:
-                    content = yaml.safe_load(f)
-                    if content.get('usageNotes'):
-                        content['usageNotes'] = content['usageNotes'].replace('\n', '  \n')
-                    if content.get('curatorNotes'):
-                        content['curatorNotes'] = content['curatorNotes'].replace('\n', '  \n')
-
             if '$schema' in content: # Use presence of $schema attribute to identify JSON Schema files
                 log.debug(f"Loading {file_name} into schema cache")
                 if (ident := content['$id']) not in cache:
                     cache[ident] = content
+                    if sources is not None:
+                        sources[ident] = file_name
                 else:
                     raise ValueError(f"Schema file {file_name} uses an $id value ({ident}) that is already in use by another schema")
         except KeyError as ex:
             raise KeyError(f"Schema file {file_name} does not contain an $id field") from ex
     return cache
 
-def dereference_cache(cache): 
-    """ Deferences $ref values in the cache. """
-    for key, schema in cache.items():
+def dereference_cache(cache, share=False):
+    """ Deferences $ref values in the cache. Each $id is resolved exactly once; the resolved
+        schemas replace the raw ones in the cache.
+
+        If share is True, resolved fragments are embedded by reference rather than copied, so
+        the same subtree may appear in several schemas. Only use this when the result is read-only.
+    """
+    resolved = {}
+    for key in cache:
         log.debug(f"Dereferencing $ref values in schema: {key}")
-        cache[key] = resolve(schema, cache)
+        resolve_id(key, cache, resolved, share)
+    cache.update(resolved)
     return cache
 
-def resolve(obj, cache):
-    """ Recursively deferences $ref values in a schema. """
+def resolve_ref(ref, cache, resolved, share=False, stack=None):
+    """ Returns the dereferenced schema for the $id ref to embed where it is referenced: the
+        memoised result itself if share is True, otherwise a copy of it.
+    """
+    result = resolve_id(ref, cache, resolved, share, stack)
+    return result if share else copy.deepcopy(result)
+
+def resolve_id(ref, cache, resolved, share=False, stack=None):
+    """ Resolves the $id ref on first use, storing the result in the resolved dict so later
+        references reuse it, and returns the stored result (not a copy).
+    """
+    stack = [] if stack is None else stack
+    if ref in stack:
+        raise ValueError(f"Circular $ref detected: {' -> '.join(stack + [ref])}")
+
+    if ref not in resolved:
+        try:
+            schema = cache[ref]
+        except KeyError:
+            raise KeyError(f"Cannot find {ref} in the schema cache") from None
+
+        stack.append(ref)
+        try:
+            resolved[ref] = resolve(schema, cache, resolved, share, stack)
+        finally:
+            stack.pop()
+
+    return resolved[ref]
+
+def resolve(obj, cache, resolved=None, share=False, stack=None):
+    """ Recursively deferences $ref values in a schema. Referenced schemas are looked up in
+        (and added to) the resolved dict, keyed by $id, and merged in without their $id and
+        $schema elements.
+    """
+    resolved = {} if resolved is None else resolved
     if isinstance(obj, dict):
         new = {}
         for key, value in obj.items():
             if key == "$ref":
-                try:
-                    result = resolve(cache[value], cache)
-                    new = {**new, **result} # Assumes that $ref always points to a dict
-                except KeyError as ex:
-                    raise KeyError(f"Cannot find {value} in the schema cache")
+                result = resolve_ref(value, cache, resolved, share, stack)
+                # Assumes that $ref always points to a dict; its own $id and $schema are not inlined
+                new.update((k, v) for k, v in result.items() if k not in ('$id', '$schema'))
             else:
-                new[key] = resolve(value, cache)
+                new[key] = resolve(value, cache, resolved, share, stack)
         return new
     elif isinstance(obj, list):
-        return [resolve(item, cache) for item in obj]
+        return [resolve(item, cache, resolved, share, stack) for item in obj]
     else:
         return obj
 
-def persist_cache(cache, temp_dir):
-    """ Persist cache to temp_dir """
+def count_refs(obj):
+    """ Returns the number of $ref elements in obj. Each $id is resolved only once, however often it is referenced. """
+    if isinstance(obj, dict):
+        return sum(1 if key == '$ref' else count_refs(value) for key, value in obj.items())
+    elif isinstance(obj, list):
+        return sum(count_refs(item) for item in obj)
+    return 0
+
+def get_top_level_schemas(cache):
+    """ Returns the top-level (titled) schemas in the cache, keyed by $id. """
+    schemas = {}
     for key, schema in cache.items():
-        if (title := schema.get('title')) is not None:
-            # path_components = urlparse(key).path.split('/')
-            # file_path = os.path.join(*path_components[1:]) # Remove first element, which is the base URI template
-            file_name = os.path.join(temp_dir, 'icpsr_study_schema.json')
-            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        if schema.get('title') is not None:
+            schemas[key] = schema
+        elif 'yaml' not in key:
+            raise ValueError(f"Cannot persist schema because it does not contain a title element: {key}")
+    return schemas
 
-            log.debug(f"Writing {title} schema to {file_name}")
+def get_version_key(version):
+    """ Returns a sort key that orders versions naturally, so v10 comes after v9. """
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
 
-            with open(file_name, 'w', encoding='utf-8') as fp:
-                json.dump(schema, fp, indent=4)
+def get_document_names(cache):
+    """ Returns the name each top-level schema's documents are given, keyed by $id. The name is
+        the last part of the $id's path; if a schema has several ?version= variants, the
+        latest keeps the plain name and the others have their version appended.
+    """
+    variants = {}
+    for key in get_top_level_schemas(cache):
+        url = urlparse(key)
+        version = parse_qs(url.query).get('version', [''])[0]
+        variants.setdefault(url.path.rstrip('/').split('/')[-1], []).append((version, key))
+
+    names = {}
+    for name, versions in variants.items():
+        latest = max(versions, key=lambda variant: get_version_key(variant[0]))
+        for version, key in versions:
+            names[key] = name if key == latest[1] else f"{name}_{version}"
+
+    if len(set(names.values())) != len(names):
+        raise ValueError(f"Top-level schemas must have distinct names or versions: {', '.join(names)}")
+    return {key: names[key] for key in get_top_level_schemas(cache)}
+
+def persist_cache(cache, temp_dir, names=None):
+    """ Persist the top-level schemas in the cache to temp_dir, in compact form, as <name>.json
+        (see get_document_names). Returns the file names, keyed by $id.
+    """
+    names = get_document_names(cache) if names is None else names
+    file_names = {}
+    for key, name in names.items():
+        schema = cache[key]
+        file_name = os.path.join(temp_dir, f"{name}.json")
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
 
-        elif 'yaml' not in key:
-            raise ValueError(f"Cannot persist schema because it does not contain a title element: {key}")
+        log.debug(f"Writing {schema['title']} schema to {file_name}")
+
+        with open(file_name, 'w', encoding='utf-8') as fp:
+            json.dump(schema, fp, separators=(',', ':'))
+        file_names[key] = file_name
 
-    return file_name
+    return file_names
 
-def clean_label(label):
+@lru_cache(maxsize=None)
+def get_template_renderer(template_file):
+    """ Returns a JSON Schema for Humans renderer for template_file, configured as for the
+        generate-schema-doc command. The compiled template is kept for the life of the process.
+    """
+    from json_schema_for_humans.generation_configuration import get_final_config
+    from json_schema_for_humans.template_renderer import TemplateRenderer
 
-    return label.replace('_', ' ').title().replace("To", "to").replace("Of", "of").replace("Id", "ID").replace("Doi", "Digital Object Identifier (DOI)").replace("IDentifier", "Identifier").replace("Sda ", "SDA ")
+    config = get_final_config(minify=True, deprecated_from_description=False, default_from_description=False, expand_buttons=False, link_to_reused_ref=True,
+                              config_parameters=[f"custom_template_path={template_file}", "show_toc=false", "show_breadcrumbs=false"])
+    return TemplateRenderer(config)
 
-def check_write(line, fo, processed_lines, index="foo"):
-    if isinstance(index, int):
-        if index not in processed_lines:
-            #write line to file-out (fo)
-            fo.write(line)
+def render_schema_markdown(schema, template_file, schema_file):
+    """ Renders the dereferenced schema dict to markdown in-process and returns it as a string.
+        schema_file is the path the schema is registered under; it does not need to exist.
+    """
+    from json_schema_for_humans.schema.intermediate_representation import build_intermediate_representation
 
-            #add index to list
-            processed_lines.append(index)
+    renderer = get_template_renderer(os.path.realpath(template_file))
+    schema_path = os.path.realpath(schema_file)
+    intermediate_schema = build_intermediate_representation(schema_path, renderer.config, {schema_path: schema})
+    return renderer.render(intermediate_schema)
 
-        else:
-            pass
+def render_changed_properties(schema, template_file, schema_file, previous_markdown, affected):
+    """ Renders schema with only the affected top-level properties in full and splices their
+        sections into the previous build's generated markdown. Returns None if that is not
+        guaranteed to match a full render.
+    """
+    partial_schema = dict(schema)
+    partial_schema['properties'] = {name: prop if name in affected else stub_property(prop) for name, prop in schema.get('properties', {}).items()}
+    partial_markdown = render_schema_markdown(partial_schema, template_file, schema_file)
+    return splice_sections(previous_markdown, partial_markdown, list(partial_schema['properties']), affected)
+
+class LineTracker:
+    """ Records which line indexes of the generated markdown have already been written (or
+        deliberately dropped). Only indexes at or ahead of the current line are kept, so the
+        tracker never holds more than the look-ahead window. written counts the lines marked
+        as written over the whole document.
+    """
 
-        return processed_lines
+    def __init__(self):
+        self._written = set()
+        self.written = 0
 
-    else:
-        fo.write(line)
+    def __contains__(self, index):
+        return index in self._written
 
-def fix_arrays(term, content):
-    found_targets = found_targets = []
-    index = 0  # Initialize the index
-
-    while index < len(content):
-        # Check if the line contains 'term'
-        if term in content[index]: 
-            # Search for 'autogenerated_heading item' after the current index
-            for next_index in range(index + 1, len(content)):
-                if all(keyword in content[next_index] for keyword in ('autogenerated_heading', 'items')):
-                    found_targets.append(next_index)  # Store the index of the target line
-                    break  # Exit the inner loop once you've found the target
-            # Move the index to the next line
-            index += 1
-            # If both keywords were found, add the current index too
+    def mark(self, *indexes):
+        self._written.update(indexes)
+        self.written += len(indexes)
 
-        else:
-            # Move to the next line
-            index += 1
+    def skip(self, *indexes):
+        """ Marks indexes as dropped, so they are never written. """
+        self._written.update(indexes)
+
+    def release(self, index):
+        """ Forgets index once the post-processor has moved past it. """
+        self._written.discard(index)
 
-    if term in ['**Type**: `array of enum (of string)`', '**Type**: `array of string`']:
-        for val in found_targets:
-            for i in range(4):
-                content[val+i] = 'SKIP\n'
+class LookAhead:
+    """ Wraps a stream of lines, allowing the lines just ahead of the current one to be read
+        without loading the rest of the stream.
+    """
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._buffer:
+            return self._buffer.popleft()
+        return next(self._lines)
+
+    def peek(self, offset):
+        """ Returns the line offset places after the one last returned, or '' past the end. """
+        while len(self._buffer) < offset:
+            try:
+                self._buffer.append(next(self._lines))
+            except StopIteration:
+                return ''
+        return self._buffer[offset-1]
+
+def check_write(line, fo, tracker, index=None):
+    """ Writes line to fo. If an index is given, the line is only written if that index has not
+        been written yet, and is then marked in the tracker.
+    """
+    if index is None:
+        fo.write(line)
+    elif index not in tracker:
+        fo.write(line)
+        tracker.mark(index)
+
+def insert_date(lines, current_date):
+    """ Inserts a 'Last updated' line below the schema title. """
+    date_line = "Last updated: {}\n\n".format(current_date.strftime('%B %d, %Y'))
+    index = 0
+    for index, line in enumerate(lines):
+        if index == 2:
+            yield date_line
+        yield line
+
+    if index < 2:
+        yield date_line
+
+#matches every array type that needs its items heading rewritten; 'skip' covers arrays of strings
+ARRAY_TYPE_PATTERN = re.compile(r'\*\*Type\*\*: `array of (?:(?P<skip>enum \(of string\)|string)|object)`')
+
+def fix_arrays(lines):
+    """ Rewrites the 'items' heading that follows an array property. For arrays of strings the
+        heading and the item's type lines are dropped; for arrays of objects the heading becomes
+        'Subfields:'.
+    """
+    #the items heading belongs to the most recent array type line; string arrays take precedence
+    pending = None
+    upcoming = deque()
+
+    for line in lines:
+        if upcoming:
+            replacement = upcoming.popleft()
+            if replacement is not None:
+                yield replacement
+                continue
+
+        if pending and 'autogenerated_heading' in line and 'items' in line:
+            if pending == 'skip':
+                line = 'SKIP\n'
+                upcoming.extend(['SKIP\n', 'SKIP\n', 'SKIP\n'])
+            else:
+                line = line.replace(' items', ' Subfields:')
+                upcoming.extend([None, 'SKIP\n', 'SKIP\n'])
+            pending = None
 
-    elif term in ['**Type**: `array of object`']:
-        for val in found_targets:
-            content[val] = content[val].replace(' items', ' Subfields:')
-            content[val+2] = 'SKIP\n'
-            content[val+3] = 'SKIP\n'
+        elif match := ARRAY_TYPE_PATTERN.search(line):
+            pending = 'skip' if match.group('skip') or pending == 'skip' else 'subfields'
 
-    return content
+        yield line
 
+@lru_cache(maxsize=256)
 def clean_data_type(data_type):
     if 'string' in data_type:
         new_data_type = ' Text'
@@ -182,18 +499,523 @@ def clean_data_type(data_type):
 
     return result_string
 
-def get_schema_description(source_dir):
-    # Specify the path to your JSON file
-    json_file_path = os.path.join(source_dir, 'schema', 'icpsr_study_schema.json')
+class LineRule:
+    """ A post-processing rule. A line matches if it starts with prefix (when given), contains
+        every string in contains and passes test (when given); matching lines go to handler.
+        The checks are combined into a single function when the rule is created.
+    """
+
+    def __init__(self, handler, prefix=None, contains=(), test=None):
+        self.handler = handler
+        self.prefix = prefix
+        self.contains = contains
+
+        checks = [(lambda line, needle=needle: needle in line) for needle in contains]
+        if prefix is not None:
+            checks.insert(0, lambda line: line.startswith(prefix))
+        if test is not None:
+            checks.append(test)
+
+        self.matches = checks[-1] if checks else (lambda line: True)
+        for check in reversed(checks[:-1]):
+            self.matches = lambda line, check=check, rest=self.matches: check(line) and rest(line)
+
+class RuleDispatcher:
+    """ Finds the first matching rule for each line, in registry order. Two compiled patterns,
+        one for the rules' prefixes and one for the strings the other rules look for anywhere
+        in a line, screen out lines no rule can match, which is most of them. The caller applies
+        the screen (MarkdownCleaner.run inlines it, as it runs once per line) and passes the
+        rest to select, which only tests the rules whose prefix starts with the line's first
+        character and the rules without a prefix. Adding rules therefore does not slow down
+        the lines they do not apply to.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._candidates = {}
+
+        #a line can only match a rule if it starts with the rule's prefix or contains its first string
+        prefixes = [rule.prefix for rule in rules if rule.prefix is not None]
+        needles = [rule.contains[0] for rule in rules if rule.prefix is None and rule.contains]
+        self.initials = frozenset(prefix[:1] for prefix in prefixes)
+        self.match_prefix = re.compile('|'.join(map(re.escape, prefixes))).match if prefixes else (lambda line: None)
+        self.search_anywhere = re.compile('|'.join(map(re.escape, needles))).search if needles else (lambda line: None)
+        if any(rule.prefix is None and not rule.contains for rule in rules):
+            self.search_anywhere = lambda line: True
+
+    def candidates(self, first_character):
+        """ Returns the rules a line starting with first_character could match. """
+        if first_character not in self._candidates:
+            self._candidates[first_character] = tuple(rule for rule in self.rules if rule.prefix is None or rule.prefix[:1] == first_character)
+        return self._candidates[first_character]
+
+    def select(self, line):
+        """ Returns the handler of the first rule a line that passed the screen matches, or None if there is none. """
+        rules = self._candidates.get(line[:1])
+        if rules is None:
+            rules = self.candidates(line[:1])
+        for rule in rules:
+            if rule.matches(line):
+                return rule.handler
+        return None
+
+class MarkdownCleaner:
+    """ Streams generated markdown lines to fo, cleaning up labels, headings, tables and data
+        types along the way. Each kind of line is handled by a rule; see get_rules.
+    """
+
+    def __init__(self, fo, description_value, metadata_key, property_index=None, schema_path='schema/icpsr_study_schema.json'):
+        self.fo = fo
+        self.description_value = description_value
+        self.metadata_key = metadata_key
+        self.schema_path = schema_path
+        #properties missing from the index are added as their table rows are read
+        self.property_dict = dict(property_index or {})
+        self.tracker = LineTracker()
+        self.content = None
+        self.first_heading = True
+        self.example_count = 0
+        self.current_element = None
+        self.accepted_value = None
+        self.dispatcher = RuleDispatcher(self.get_rules())
+
+    def get_rules(self):
+        """ Returns the rules in the order they are tried; the first match wins. """
+        return [
+            LineRule(self.property_row, prefix='| [', test=lambda line: line.count('|') == 6),
+            LineRule(self.heading, contains=('##', '<a name=')),
+            LineRule(self.type_line, prefix='**Type**'),
+            LineRule(self.additional_properties, contains=('**Additional properties**: [[Not allowed]](# "Additional Properties not allowed.")',)),
+            LineRule(self.skip_line, prefix='SKIP'),
+            LineRule(self.description, contains=(self.description_value,)),
+            LineRule(self.examples, prefix='**Examples:**'),
+        ]
+
+    def run(self, lines):
+        """ Cleans lines, writing them to fo. Returns the number of lines read and how many of them were dropped. """
+        self.content = LookAhead(lines)
+        tracker = self.tracker
+        #the dispatcher's screen; this loop runs once per line
+        initials, match_prefix, search_anywhere = self.dispatcher.initials, self.dispatcher.match_prefix, self.dispatcher.search_anywhere
+        select = self.dispatcher.select
+        index = -1
+
+        #loop through content and fix various issues; lines no rule matches are written as they are
+        for index, line in enumerate(self.content):
+            #earlier lines can no longer be written, so stop tracking them
+            tracker.release(index-1)
+            handler = select(line) if (line[:1] in initials and match_prefix(line)) or search_anywhere(line) else None
+            if handler is None:
+                check_write(line, self.fo, tracker, index)
+            else:
+                handler(index, line)
+
+        return index + 1, index + 1 - self.tracker.written
+
+    def property_row(self, index, line):
+        """ Cleans up the label and data type in a table row that defines a property. """
+        #split on pipe; [1]=label/anchor, [2]=required?, [3]=repeatable, [4]=data type
+        parts = line.split('|')
+        orig_label, _, prop_name = parts[1].strip()[1:].partition('](#')
+        prop_name = prop_name.partition(')')[0].strip()
+        if orig_label and prop_name:
+            if prop_name not in self.property_dict:
+                self.property_dict[prop_name] = {"required": parts[2].strip(), "repeatable": parts[3].strip(), "label": orig_label, "cleaned_label": clean_label(orig_label.strip())}
+            entry = self.property_dict[prop_name]
+
+            #clean up labels and data types
+            line = line.replace(f"[{entry['label']}]", f"[{entry['cleaned_label']}]").replace(parts[4], clean_data_type(parts[4]))
+            check_write(line, self.fo, self.tracker, index)
 
-    # Open and parse the JSON file
-    with open(json_file_path, 'r') as json_file:
-        data = json.load(json_file)
+    def heading(self, index, line):
+        """ Rewrites a property heading, adding its required and repeatable statements. """
+        fo, tracker = self.fo, self.tracker
 
-    # Access the value of the first 'description' key
-    description_value = data.get('description')
+        #reset our example_count variable--we need to see if there are multiple 'Example' sections under any one heading
+        self.example_count = 0
+
+        #if this is the first ## heading, we need to insert our metadata record key
+        if self.first_heading:
+
+            with open(self.metadata_key, 'r', encoding='utf-8') as fi:
+                key_content = fi.readlines()
+
+            for info in key_content:
+                check_write(info, fo, tracker)
+
+            check_write('\n## Metadata Elements: Detailed Information\n\n', fo, tracker)
+
+            #change our flag so we don't add the key again!
+            self.first_heading = False
+
+        #get the name of the current element, for later use with subfield example heading, if needed
+        if line.startswith("## "):
+            self.current_element = line.split('.')[-1].strip()
+
+        #headings carry an anchor link named after the property
+        name_attr_value = line.partition('<a name="')[2].partition('"')[0]
+        if name_attr_value:
+            if "autogenerated_heading" in name_attr_value:
+
+                line = '#' + line
+                check_write(line, fo, tracker, index)
+
+            elif self.property_dict.get(name_attr_value):
+                entry = self.property_dict[name_attr_value]
+                text = line.split('</a>')
+                text[1] = text[1].replace(entry['label'], entry['cleaned_label']).replace('[optional]', '').replace('[required]', '')
+                anchor_line = '</a>'.join(text)
+
+                #we will add an extra '#' to headings
+                anchor_line = '#' + anchor_line
+
+                check_write(anchor_line, fo, tracker, index)
+                check_write("\n", fo, tracker)
+
+                # We are going to assume that there is a description associated with every property; skip 2 index spaces to write description
+                description_line = self.content.peek(2)
+                check_write(description_line, fo, tracker, index+2)
+
+                #account for newline after description
+                check_write("\n", fo, tracker, index+3)
+
+                #add required? statement
+                check_write(f"**Required**: {entry['required']}\n\n", fo, tracker)
+
+                #add repeatable? statement
+                check_write(f"**Repeatable**: {entry['repeatable']}\n", fo, tracker)
+
+                #If this is a main element, get name for later use with subfield example heading, if needed
+                if line.startswith("## "):
+                    self.current_element = entry['cleaned_label']
+
+    def type_line(self, index, line):
+        """ Replaces a type line, and the format line that may follow it, with accepted values. """
+        data_type = line.split(':')[1].strip().replace('`', '')
+
+        #check for specific format_type rules
+        format_type = ''
+        if self.content.peek(2).startswith("**Format**:"):
+            format_type = self.content.peek(2).split(':')[1].strip().replace('`', '').replace('uri', 'URL')
+
+            #add format line and following new line to the tracker
+            self.tracker.skip(index+2, index+3)
+
+        #other types keep the previous accepted value, as they always have
+        if 'string' in data_type:
+            self.accepted_value = 'Text'
+            if len(format_type) > 0:
+                self.accepted_value += f" (formatted as a {format_type})"
+        elif 'integer' in data_type:
+            self.accepted_value = 'Number'
+        elif 'object' in data_type:
+            self.accepted_value = 'Multi-part element; see subfield definitions for more information.'
+
+        check_write(f"**Accepted Values**: {self.accepted_value}\n", self.fo, self.tracker, index)
+
+    def additional_properties(self, index, line):
+        self.tracker.skip(index, index+1)
+
+    def skip_line(self, index, line):
+        self.tracker.skip(index)
 
-    return description_value
+    def description(self, index, line):
+        """ Writes the schema description, followed by the link to the JSON Schema and the overview heading. """
+        check_write(line, self.fo, self.tracker, index)
+        check_write('\n', self.fo, self.tracker, index+1)
+        check_write(f'For a machine-actionable copy of this information, please see the [JSON Schema version]({SCHEMA_URL.format(self.schema_path)}).\n\n## Metadata Elements: Overview\n\n', self.fo, self.tracker)
+
+    def examples(self, index, line):
+        """ Relabels the second 'Examples' section under a heading, which is a full example with all subfields. """
+        #Add one to our example count
+        self.example_count += 1
+        #if our count is now at 2 it means we have consecutive 'Example' sections under one heading. Adjust the label. If count is at one, just write the line to file-out.
+        if self.example_count == 2:
+            check_write(f'###### Complete {self.current_element} Examples (with Subfields):', self.fo, self.tracker, index)
+        else:
+            check_write(line, self.fo, self.tracker, index)
+
+def clean_markdown(lines, fo, description_value, metadata_key, property_index=None, schema_path='schema/icpsr_study_schema.json'):
+    """ Streams the generated markdown lines to fo, cleaning up labels, headings,
+        tables and data types along the way. Property facts come from property_index (see
+        property_index.build_property_index); schema_path is the schema file the document
+        links to, relative to the repository. Returns the number of lines read and how
+        many of them were dropped.
+    """
+    return MarkdownCleaner(fo, description_value, metadata_key, property_index, schema_path).run(lines)
+
+def post_process_markdown(lines, fo, description_value, metadata_key, current_date, property_index=None, schema_path='schema/icpsr_study_schema.json'):
+    """ Streams the generated markdown lines through each clean-up stage, writing the result to
+        fo in a single pass. Returns the number of lines processed and skipped.
+    """
+    lines = insert_date(lines, current_date)
+    lines = fix_arrays(lines)
+    return clean_markdown(lines, fo, description_value, metadata_key, property_index, schema_path)
+
+def get_last_updated(source_dir, source_hashes, previous):
+    """ Returns when the schema files whose hashes are in source_hashes last changed: the date
+        recorded in previous (the document's entry in the last build manifest) if none of them
+        has changed since, else the date of the last commit to change them if they are all
+        committed, else now.
+    """
+    if previous.get('sources') == source_hashes and previous.get('updated'):
+        return datetime.datetime.fromisoformat(previous['updated'])
+    file_names = [os.path.join(source_dir, file_name) for file_name in source_hashes]
+    return get_commit_date(source_dir, file_names) or datetime.datetime.now()
+
+def build_document(task):
+    """ Renders and post-processes the markdown document for one top-level schema. task is a
+        dict made by build() holding everything needed, so documents can be built in worker
+        processes. Returns a summary of the build, including its profile.
+    """
+    start = time.perf_counter()
+    profiler = Profiler(f"generate_markdown_schema.{task['name']}", task['profile'], task['profile_stage'], task['profile_dir'], labels={'schema': task['name']})
+    schema, md_file, raw_file, affected = task['schema'], task['md_file'], task['raw_file'], task['affected']
+
+    #generate markdown using modified version of JSON Schema for Humans
+    with profiler.stage('render'):
+        markdown = None
+        if affected:
+            mode = 'spliced'
+            profiler.count('properties_rerendered', len(affected))
+            with open(raw_file, 'r', encoding='utf-8') as fi:
+                markdown = render_changed_properties(schema, task['template_file'], task['dereferenced_file'], fi.read(), affected)
+            if markdown is None:
+                mode = 'splice_failed'
+        elif affected is not None:
+            mode = 'reused'
+            with open(raw_file, 'r', encoding='utf-8') as fi:
+                markdown = fi.read()
+        else:
+            mode = 'full'
+
+        if markdown is None and task['external_generator']:
+            cmd = "generate-schema-doc --config custom_template_path={} --config show_toc=false --config show_breadcrumbs=false {} {}".format(task['template_file'], task['dereferenced_file'], raw_file)
+            subprocess.run(cmd, shell=True, text=True)
+            with open(raw_file, 'r', encoding='utf-8') as fi:
+                markdown = fi.read()
+        elif markdown is None:
+            markdown = render_schema_markdown(schema, task['template_file'], task['dereferenced_file'])
+
+    #keep the generator's output so the next build can splice changed sections into it
+    write_if_changed(raw_file, markdown)
+
+    #now stream our schema markdown through the clean-up stages to make final improvements
+    with profiler.stage('post_process'):
+        with open(f"{md_file}.tmp", 'w', encoding='utf-8') as fo:
+            lines_processed, lines_skipped = post_process_markdown(io.StringIO(markdown), fo, schema.get('description'), task['metadata_key'], task['current_date'],
+                                                                   build_property_index(schema), task['schema_path'])
+        #an unchanged document is left alone, so the HTML build and deploy need not run
+        output = hash_file(f"{md_file}.tmp")
+        written = output != hash_file(md_file)
+        if written:
+            os.replace(f"{md_file}.tmp", md_file)
+        else:
+            os.remove(f"{md_file}.tmp")
+    profiler.count('lines_processed', lines_processed)
+    profiler.count('lines_skipped', lines_skipped)
+    profiler.count('documents_written', written)
+
+    return {'name': task['name'], 'mode': mode, 'affected': sorted(affected or []), 'lines': lines_processed, 'seconds': time.perf_counter() - start,
+            'written': written, 'raw': hash_file(raw_file), 'output': output, 'profile': profiler.report()}
+
+def describe_document_build(result):
+    """ Returns a short description of how build_document built a document. """
+    if result['mode'] == 'spliced':
+        return f"re-rendered changed properties ({', '.join(result['affected'])})"
+    if result['mode'] == 'splice_failed':
+        return "changed sections cannot be spliced in; rendered the whole schema"
+    if result['mode'] == 'reused':
+        return "no documented properties use the changed files"
+    return "rendered the whole schema"
+
+def build(args, parsed_cache=None, profiler=None):
+    """ Builds the markdown documents for every top-level schema, and every version of it, in
+        args.source_dir. parsed_cache is reused if given, so repeated builds in one process keep
+        parsed files in memory. Schema files are parsed and dereferenced once; when there are
+        several documents, they are rendered in parallel worker processes. Stages and counts
+        are recorded in profiler (an instrumentation.Profiler), if given.
+    """
+    profiler = profiler or Profiler('generate_markdown_schema', enabled=False)
+
+    #set up variables
+    site_dir = os.path.join(args.source_dir, 'site')
+    markdown_dir = os.path.join(args.source_dir, 'markdown')
+    resource_dir = os.path.join(args.source_dir, 'resources')
+    temp_dir = os.path.join(args.source_dir, 'temp')
+    metadata_key = os.path.join(resource_dir, 'key.md')
+
+    cache_dir = os.path.join(args.source_dir, '.cache')
+    #the manifest changes with every schema change, so it is kept out of the published markdown folder
+    manifest_file = os.path.join(cache_dir, "schema_docs.manifest.json")
+    template_file = os.path.join(resource_dir, 'template', 'base.md')
+
+    for folder in [site_dir, markdown_dir, cache_dir]:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    #compare source, template and output hashes with the last build; if nothing changed there is nothing to do
+    with profiler.stage('check_manifest'):
+        manifest = load_manifest(manifest_file)
+        documents = manifest.get('documents', {})
+        source_hashes = hash_files(args.source_dir, get_schema_files(args.source_dir))
+        template_hashes = hash_files(args.source_dir, get_template_files(resource_dir))
+        intact = set()
+        if manifest.get('templates') != template_hashes:
+            #a renderer compiled earlier in this process (in watch mode) would still use the old templates
+            get_template_renderer.cache_clear()
+        else:
+            intact = {name for name, entry in documents.items() if entry['output'] == hash_file(os.path.join(args.source_dir, entry['md_file']))}
+    profiler.count('schema_files', len(source_hashes))
+    profiler.count('template_files', len(template_hashes))
+    if not args.force and documents and intact == set(documents) and manifest.get('sources') == source_hashes:
+        print("\tNo schema or template changes since the last build; nothing to do")
+        return
+
+    #produce a dereferenced json file
+    print("\tProducing cache...")
+    if parsed_cache is None and not args.no_parse_cache:
+        parsed_cache_file = os.path.join(cache_dir, 'parsed_schemas.pickle')
+        if args.clear_parse_cache and os.path.exists(parsed_cache_file):
+            os.remove(parsed_cache_file)
+        parsed_cache = ParsedSchemaCache(parsed_cache_file)
+    elif parsed_cache is not None:
+        parsed_cache.hits = parsed_cache.misses = 0
+
+    sources = {}
+    timings = {}
+    with profiler.stage('load_cache'):
+        cache = load_cache(args.source_dir, sources, timings, args.workers, parsed_cache)
+    profiler.count('files_parsed', len(timings))
+    profiler.count('schemas_loaded', len(cache))
+    if parsed_cache is not None:
+        print(f"\tParse cache: {parsed_cache.hits} hits, {parsed_cache.misses} misses")
+        profiler.count('parse_cache_hits', parsed_cache.hits)
+        profiler.count('parse_cache_misses', parsed_cache.misses)
+    if args.parse_timings:
+        for file_name, elapsed in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+            print(f"\t\t{elapsed * 1000:8.2f} ms  {relative_path(args.source_dir, file_name)}")
+    names = get_document_names(cache)
+    dependencies = {key: get_property_dependencies(cache[key], cache) for key in names}
+    document_dependencies = {key: get_document_dependencies(cache[key], cache) for key in names}
+    if profiler.enabled:
+        profiler.count('ref_occurrences', count_refs(cache))
+    #resolved fragments are shared between schemas; the cache is only read from here on
+    with profiler.stage('dereference_cache'):
+        cache = dereference_cache(cache, share=True)
+
+    #the generator command reads the schemas from disk; otherwise only write them out if asked to
+    dereferenced_files = {key: os.path.join(temp_dir, f"{name}.json") for key, name in names.items()}
+    if args.keep_temp or args.external_generator:
+        print("\tSaving temp file...")
+        with profiler.stage('persist_cache'):
+            dereferenced_files = persist_cache(cache, temp_dir, names)
+
+    #if only YAML fragments changed, work out which top-level properties of each schema use them
+    changed_ids = None
+    if not args.force and not args.external_generator and set(manifest.get('sources', {})) == set(source_hashes):
+        changed_files = {name for name, digest in source_hashes.items() if manifest['sources'][name] != digest}
+        changed_ids = {ident for ident, file_name in sources.items() if relative_path(args.source_dir, file_name) in changed_files}
+
+    tasks = []
+    dates = {}
+    current_date = datetime.datetime.now()
+    for key, name in names.items():
+        md_file = os.path.join(markdown_dir, f"{name}.md")
+        raw_file = os.path.join(cache_dir, f"{name}.raw.md")
+        previous = documents.get(name, {})
+
+        #date each document by its own schema files, so it only changes when they do
+        if args.date_from == 'sources':
+            file_names = {sources[key]} | {sources[ident] for idents in [*dependencies[key].values(), document_dependencies[key]] for ident in idents}
+            document_hashes = {path: source_hashes[path] for path in sorted(relative_path(args.source_dir, file_name) for file_name in file_names)}
+            current_date = get_last_updated(args.source_dir, document_hashes, previous)
+            dates[name] = {'sources': document_hashes, 'updated': current_date.isoformat()}
+
+        #a change outside the properties (e.g. to a fragment in allOf) needs the whole document rendered
+        affected = None
+        if changed_ids is not None and name in intact and previous.get('schema_id') == key and key not in changed_ids and not changed_ids.intersection(document_dependencies[key]) and previous.get('raw') == hash_file(raw_file):
+            affected = {prop for prop, idents in dependencies[key].items() if changed_ids.intersection(idents)}
+
+        tasks.append({'name': name, 'schema_id': key, 'schema': cache[key], 'schema_path': relative_path(args.source_dir, sources[key]),
+                      'md_file': md_file, 'raw_file': raw_file, 'dereferenced_file': dereferenced_files[key], 'template_file': template_file,
+                      'metadata_key': metadata_key, 'current_date': current_date, 'affected': affected, 'external_generator': args.external_generator,
+                      'profile': profiler.enabled, 'profile_stage': profiler.profile_stage, 'profile_dir': profiler.profile_dir})
+
+    #each document is independent; render them in parallel when there is more than one
+    print(f"\tCreating markdown for {len(tasks)} schema document(s)...")
+    if len(tasks) > 1 and args.workers != 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(build_document, tasks))
+    else:
+        results = [build_document(task) for task in tasks]
+
+    entries = {}
+    for task, result in zip(tasks, results):
+        profiler.merge(result['profile'])
+        print(f"\t\t{relative_path(args.source_dir, task['md_file'])}: {describe_document_build(result)}; {result['lines']} lines in {result['seconds']:.2f}s{'' if result['written'] else '; unchanged, not written'}")
+        entries[task['name']] = {'schema_id': task['schema_id'], 'md_file': relative_path(args.source_dir, task['md_file']), 'dependencies': dependencies[task['schema_id']],
+                                 'document_dependencies': document_dependencies[task['schema_id']], 'raw': result['raw'], 'output': result['output'], **dates.get(task['name'], {})}
+
+    save_manifest(manifest_file, {'sources': source_hashes, 'templates': template_hashes, 'documents': entries})
+
+    #remove temp folder
+    if not args.keep_temp:
+        print("\n\nRemoving temp folder...")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def get_snapshot(source_dir, resource_dir):
+    """ Returns the mtime and size of every schema file and template, keyed by path. """
+    snapshot = {}
+    for file_name in get_schema_files(source_dir) + get_template_files(resource_dir):
+        try:
+            stat = os.stat(file_name)
+            snapshot[file_name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+    return snapshot
+
+def watch(source_dir, resource_dir, rebuild, interval=None, debounce=0.2):
+    """ Calls rebuild whenever a schema file or template changes, until interrupted. Uses
+        filesystem events when watchdog is installed and polls every interval seconds otherwise.
+        Changes are debounced so that a burst of saves triggers a single rebuild.
+    """
+    changed = threading.Event()
+    observer = None
+    if Observer is not None:
+        handler = FileSystemEventHandler()
+        handler.on_any_event = lambda event: changed.set()
+        observer = Observer()
+        for folder in (os.path.join(source_dir, 'schema'), resource_dir):
+            observer.schedule(handler, folder, recursive=True)
+        observer.start()
+    #with filesystem events, polling is only a safety net
+    interval = interval or (2.0 if observer else 0.25)
+
+    try:
+        snapshot = get_snapshot(source_dir, resource_dir)
+        while True:
+            changed.wait(interval)
+            changed.clear()
+            current = get_snapshot(source_dir, resource_dir)
+            if current == snapshot:
+                continue
+
+            #wait for editors to finish writing before rebuilding
+            while True:
+                time.sleep(debounce)
+                latest = get_snapshot(source_dir, resource_dir)
+                if latest == current:
+                    break
+                current = latest
+            snapshot = current
+            rebuild()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer:
+            observer.stop()
+            observer.join()
 
 def main():
     """ Main entrypoint. """
@@ -205,205 +1027,59 @@ def main():
             print(f"{args.source_dir} does not exist. Please verify path and try again")
             sys.exit(1)
 
-        #set up variables
-        site_dir = os.path.join(args.source_dir, 'site')
-        markdown_dir = os.path.join(args.source_dir, 'markdown')
+        if args.profile_report or args.profile_stage:
+            args.profile = True
+        profile_report = args.profile_report or os.path.join(args.source_dir, '.cache', 'profile', 'generate_markdown_schema.json')
+
+        if not args.watch:
+            profiler = Profiler('generate_markdown_schema', args.profile, args.profile_stage, os.path.dirname(os.path.abspath(profile_report)))
+            build(args, profiler=profiler)
+            if args.html:
+                run_mkdocs.build_site(args.source_dir, profiler, skip_unchanged=True)
+            profiler.print_summary()
+            profiler.save(profile_report)
+            print("\nAll done!")
+            return
+
+        #keep parsed files and compiled templates in memory between rebuilds
         resource_dir = os.path.join(args.source_dir, 'resources')
-        temp_dir = os.path.join(args.source_dir, 'temp')
-        mkdocs_yml = os.path.join(resource_dir, 'mkdocs.yml')
-        rtd_css = os.path.join(resource_dir, 'readthedocs_theme.css')
-        metadata_key = os.path.join(resource_dir, 'key.md')
-        
-        for folder in [temp_dir, site_dir, markdown_dir]:
-            if not os.path.exists(folder):
-                os.makedirs(folder)
-        
-        #produce a dereferenced json file
-        print("\tProducing cache...")
-        cache = dereference_cache(load_cache(args.source_dir))
-        print("\tSaving temp file...")
-        dereferenced_file = persist_cache(cache, temp_dir)
-
-        #remove extra $id and $schema values
-        print("\tRemoving extra $id and $schema values...")
-        with open(dereferenced_file, "r", encoding="utf-8") as f:
-            content = json.load(f)
-
-        #remove additional $id and $schema entries
-        for k, v in content.items():
-            for key, value in content['properties'].items():
-                content['properties'][key].pop('$id', None)
-                content['properties'][key].pop('$schema', None)
-            
-        #write back to dereferenced json
-        with open(dereferenced_file, "w", encoding="utf-8") as f:
-            json.dump(content, f, indent=4)
-            
-        #generate markdown using modified version of JSON Schema for Humans
-        print("\tCreating markdown...")
-        md_file = os.path.join(markdown_dir, "icpsr_study_schema.md")
-
-        cmd = "generate-schema-doc --config custom_template_path={} --config show_toc=false --config show_breadcrumbs=false {} {}".format(os.path.join(resource_dir, 'template', 'base.md'), dereferenced_file, md_file)
-
-        subprocess.run(cmd, shell=True, text=True)
-
-        #now read in all our schema markdown to make final improvements 
-        print("\tFixing labels...")
-        with open(md_file, 'r', encoding='utf-8') as fi:
-            content=fi.readlines()
-
-        #update schema description to include date
-        current_date=datetime.datetime.now()
-        content.insert(2, "Last updated: {}\n\n".format(current_date.strftime('%B %d, %Y')))
-
-        #fix array references
-        for term in ['**Type**: `array of enum (of string)`', '**Type**: `array of string`', '**Type**: `array of object`']:
-            content = fix_arrays(term, content)
-
-        #set variables
-        property_dict = {}
-        pattern = r'\[([^\]]+)\]\(#([^\)]+)\)'
-        anchor_pattern = r'#+\s*<a name="([^"]+)">'
-        processed_lines = []
-        description_value = get_schema_description(args.source_dir)
-        first_heading = True
-        example_count = 0
-
-        #loop through content and fix various issues
-        with open(md_file, 'w', encoding='utf-8') as fo:
-            for index, line in enumerate(content):
-                #need to insert 
-
-                #build dict of components; look for markdown tables that include property definitions
-                if line.startswith('| [') and line.count('|') == 6:
-                    #split on pipe; [1]=label/anchor, [2]=required?, [3]=repeatable, [4]=data type
-                    parts = line.split('|')
-                    match = re.search(pattern, parts[1])
-                    if match:
-                        orig_label = match.group(1)
-                        cleaned_label = clean_label(orig_label.strip())
-                        prop_name = match.group(2).strip()
-                        
-                        #create a dictionary entry; use the property name as key and manditoriness as value (yes/no)
-                        property_dict[prop_name] = {"mandatory": parts[2].strip(), "repeatable": parts[3].strip(), "data_type": parts[4], "orig_label": orig_label, "cleaned_label": cleaned_label}
-
-                        #clean up data types
-                        new_data_type = clean_data_type(property_dict[prop_name]['data_type'])
-
-                        line = line.replace(f'[{orig_label}]', f'[{cleaned_label}]').replace(property_dict[prop_name]['data_type'], new_data_type)
-                        processed_lines = check_write(line, fo, processed_lines, index)
-                        
-                elif "##" in line and "<a name=" in line:
-                    #reset our example_count variable--we need to see if there are multiple 'Example' sections under any one heading
-                    example_count = 0
-
-                    #if this is the first ## heading, we need to insert our metadata record key
-                    if first_heading:
-
-                        with open(metadata_key, 'r', encoding='utf-8') as fi:
-                            key_content = fi.readlines()
-
-                        for info in key_content:
-                            check_write(info, fo, processed_lines)
-
-                        check_write('\n## Metadata Elements: Detailed Information\n\n', fo, processed_lines)
-
-                        #change our flag so we don't add the key again!
-                        first_heading = False
-
-                    #get the name of the current element, for later use with subfield example heading, if needed
-                    if line.startswith("## "):
-                        current_element = line.split('.')[-1].strip()
-
-                    #verify if line matches our anchor pattern; this means it will be a heading, with an anchor link
-                    match = re.search(anchor_pattern, line)
-                    if match:
-                        name_attr_value = match.group(1)
-                        if "autogenerated_heading" in name_attr_value:
-
-                            line = '#' + line
-                            processed_lines = check_write(line, fo, processed_lines, index)
-
-                        elif property_dict.get(name_attr_value):
-                            entry = property_dict[name_attr_value]
-                            text = line.split('</a>')
-                            text[1] = text[1].replace(entry['orig_label'], entry['cleaned_label']).replace('[optional]', '').replace('[required]', '')
-                            anchor_line = '</a>'.join(text)
-
-                            #we will add an extra '#' to headings
-                            anchor_line = '#' + anchor_line
-
-                            processed_lines = check_write(anchor_line, fo, processed_lines, index)
-                            check_write("\n", fo, processed_lines)
-
-                            # We are going to assume that there is a description associated with every property; skip 2 index spaces to write description
-                            description_line = content[index+2]
-                            processed_lines = check_write(description_line, fo, processed_lines, index+2)
-
-                            #account for newline after description
-                            processed_lines = check_write("\n", fo, processed_lines, index+3)
-
-                            #add required? statement
-                            check_write(f"**Required**: {entry['mandatory']}\n\n", fo, processed_lines)
-
-                            #add repeatable? statement
-                            check_write(f"**Repeatable**: {entry['repeatable']}\n", fo, processed_lines)
-
-                            #If this is a main element, get name for later use with subfield example heading, if needed
-                            if line.startswith("## "):
-                                current_element = entry['cleaned_label']
-
-                elif line.startswith("**Type**"):
-                    data_type = line.split(':')[1].strip().replace('`', '')
-
-                    #check for specific format_type rules
-                    format_type = ''
-                    if content[index+2].startswith("**Format**:"):
-                        format_type = content[index+2].split(':')[1].strip().replace('`', '').replace('uri', 'URL')
-
-                        #add format line and following new line to processed_lines
-                        processed_lines.extend([index+2, index+3])
-
-                    if 'string' in data_type:
-                        accepted_value = 'Text'
-                        if len(format_type) > 0:
-                            accepted_value += f" (formatted as a {format_type})"
-                    elif 'integer' in data_type:
-                        accepted_value = 'Number'
-                    elif 'object' in data_type:
-                        accepted_value = 'Multi-part element; see subfield definitions for more information.'
-
-                    processed_lines = check_write(f"**Accepted Values**: {accepted_value}\n", fo, processed_lines, index)
-
-                elif '**Additional properties**: [[Not allowed]](# "Additional Properties not allowed.")' in line:
-                    processed_lines.append(index)
-                    processed_lines.append(index+1)
-
-                elif line.startswith('SKIP'):
-                    processed_lines.append(index)
-
-                elif description_value in line:
-                    processed_lines = check_write(line, fo, processed_lines, index)
-                    processed_lines = check_write('\n', fo, processed_lines, index+1)
-                    check_write('For a machine-actionable copy of this information, please see the [JSON Schema version](https://github.com/TEST/metadata/blob/main/schema/icpsr_study_schema.json).\n\n## Metadata Elements: Overview\n\n', fo, processed_lines)
-
-                #check to see if this is the second 'example' in a given section--if so, change the heading so that it's clear this is a full example with all subfields 
-                elif line.startswith('**Examples:**'):
-                    #Add one to our example count
-                    example_count += 1
-                    #if our count is now at 2 it means we have consecutive 'Example' sections under one heading. Adjust the label. If count is at one, just write the line to file-out.
-                    if example_count == 2:
-                        processed_lines = check_write(f'###### Complete {current_element} Examples (with Subfields):', fo, processed_lines, index)
-                    else:
-                        processed_lines = check_write(line, fo, processed_lines, index)
-
-                else:
-                    processed_lines = check_write(line, fo, processed_lines, index)
-            
-        #remove temp folder
-        print("\n\nRemoving temp folder...")
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        print("\nAll done!")
+        parsed_cache = None
+        if not args.no_parse_cache:
+            parsed_cache_file = os.path.join(args.source_dir, '.cache', 'parsed_schemas.pickle')
+            if args.clear_parse_cache and os.path.exists(parsed_cache_file):
+                os.remove(parsed_cache_file)
+            parsed_cache = ParsedSchemaCache(parsed_cache_file)
+
+        html_built = False
+        #edited scripts cannot take effect in this process, so they are reported rather than built with the old code
+        scripts = [file_name for file_name in get_template_files(resource_dir) if file_name.endswith('.py')]
+        script_hashes = hash_files(args.source_dir, scripts)
+
+        def rebuild():
+            nonlocal html_built
+            if changed := [name for name, digest in hash_files(args.source_dir, scripts).items() if digest != script_hashes.get(name)]:
+                log.warning(f"{', '.join(changed)} changed since watching started; restart to rebuild with the new code")
+                return
+            start = time.perf_counter()
+            #each rebuild gets a fresh report, so the saved one always describes the latest build
+            profiler = Profiler('generate_markdown_schema', args.profile, args.profile_stage, os.path.dirname(os.path.abspath(profile_report)))
+            try:
+                build(args, parsed_cache, profiler)
+                if args.html:
+                    #after the first clean build, only re-render the pages that changed
+                    run_mkdocs.build_site(args.source_dir, profiler, dirty=html_built, skip_unchanged=True)
+                    html_built = True
+                profiler.print_summary()
+                profiler.save(profile_report)
+                print(f"\tRebuilt in {time.perf_counter() - start:.2f}s; watching for changes...")
+            except Exception as ex: # pylint: disable=broad-except
+                log.error(ex)
+
+        rebuild()
+        #only the first build may be forced; later ones are incremental
+        args.force = False
+        args.clear_parse_cache = False
+        watch(args.source_dir, resource_dir, rebuild)
 
     except Exception as ex: # pylint: disable=broad-except
         log.error(ex)
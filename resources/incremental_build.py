@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+""" Build manifest and markdown splicing helpers used by generate_markdown_schema.py to skip
+    unchanged builds and to re-render only the top-level properties affected by a change.
+
+    The manifest records content hashes of every schema source file and every template or
+    script that shapes the output, plus the $id values each top-level property depends on.
+"""
+import os
+import re
+import json
+import hashlib
+import datetime
+import subprocess
+
+SECTION_PATTERN = re.compile(r'^## <a name="([^"]+)"></a>')
+AUTOGENERATED_PATTERN = re.compile(r'autogenerated_heading_(\d+)')
+ROW_ANCHOR_PATTERN = re.compile(r'\]\(#([^)\s]+)\s*\)')
+
+#bytes hash_file reads at a time
+HASH_CHUNK_SIZE = 2**20
+
+#keywords that feed the overview table; unaffected properties are cut down to these
+STUB_KEYS = ('type', 'title', 'description', 'deprecated', 'enum', 'const', 'format', 'pattern')
+
+def relative_path(root_dir, file_name):
+    """ Returns file_name relative to root_dir, with forward slashes so manifests are portable. """
+    return os.path.relpath(file_name, root_dir).replace(os.sep, '/')
+
+def hash_file(file_name):
+    """ Returns the sha256 hex digest of a file's content, or None if it does not exist. The
+        file is read in chunks, so large files are not held in memory.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+def hash_files(root_dir, file_names):
+    """ Returns a dict of content hashes keyed by path relative to root_dir. """
+    return {relative_path(root_dir, file_name): hash_file(file_name) for file_name in sorted(file_names)}
+
+def load_manifest(file_name):
+    """ Loads a build manifest, returning an empty dict if there is none. """
+    try:
+        with open(file_name, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(file_name, manifest):
+    """ Writes a build manifest, unless it is unchanged. """
+    write_if_changed(file_name, json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+
+def write_if_changed(file_name, content):
+    """ Writes the text content to file_name unless the file already holds it, so unchanged
+        files keep their modification time and do not look changed downstream. Returns True
+        if the file was written.
+    """
+    try:
+        with open(file_name, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    if os.path.dirname(file_name):
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(f"{file_name}.tmp", 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(f"{file_name}.tmp", file_name)
+    return True
+
+def get_commit_date(root_dir, file_names):
+    """ Returns the date of the last commit that changed any of file_names, or None if root_dir
+        is not a git checkout, the files are not committed or any has uncommitted changes. A
+        shallow clone only knows its latest commit, so this needs the full history.
+    """
+    paths = sorted({relative_path(root_dir, file_name) for file_name in file_names})
+    try:
+        if subprocess.run(['git', 'status', '--porcelain', '--', *paths], cwd=root_dir, capture_output=True, text=True, check=True).stdout.strip():
+            return None
+        date = subprocess.run(['git', 'log', '-1', '--format=%cI', '--', *paths], cwd=root_dir, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return datetime.datetime.fromisoformat(date) if date else None
+
+def collect_refs(obj, refs=None):
+    """ Returns the set of $ref values used directly within obj. """
+    refs = set() if refs is None else refs
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key == '$ref':
+                refs.add(value)
+            else:
+                collect_refs(value, refs)
+    elif isinstance(obj, list):
+        for item in obj:
+            collect_refs(item, refs)
+    return refs
+
+def get_ref_closure(ident, cache, closures):
+    """ Returns the set of $id values the schema ident references directly or through other
+        fragments, memoised in the closures dict.
+    """
+    if ident not in closures:
+        closures[ident] = set()
+        for ref in collect_refs(cache.get(ident, {})):
+            closures[ident] |= {ref} | get_ref_closure(ref, cache, closures)
+    return closures[ident]
+
+def get_dependencies(obj, cache, closures=None):
+    """ Returns the sorted $id values obj references directly or through other fragments. """
+    closures = {} if closures is None else closures
+    idents = set()
+    for ref in collect_refs(obj):
+        idents |= {ref} | get_ref_closure(ref, cache, closures)
+    return sorted(idents)
+
+def get_property_dependencies(schema, cache):
+    """ Returns, for each top-level property of a (not yet dereferenced) schema, the sorted $id
+        values it references directly or through other fragments.
+    """
+    closures = {}
+    return {name: get_dependencies(prop, cache, closures) for name, prop in schema.get('properties', {}).items()}
+
+def get_document_dependencies(schema, cache):
+    """ Returns the sorted $id values referenced by the parts of a (not yet dereferenced) schema
+        outside its properties, such as allOf, items or definitions. These can shape the whole
+        document, so a change to any of them cannot be spliced into single property sections.
+    """
+    return get_dependencies({key: value for key, value in schema.items() if key != 'properties'}, cache)
+
+def stub_property(prop):
+    """ Cuts a dereferenced property down to the keywords shown in the overview table. """
+    stub = {key: prop[key] for key in STUB_KEYS if key in prop}
+    if isinstance(prop.get('items'), dict):
+        stub['items'] = {key: prop['items'][key] for key in STUB_KEYS if key in prop['items']}
+    return stub
+
+def split_sections(markdown, names):
+    """ Splits generated markdown into the lines before the first property section and a dict
+        of each top-level property's section lines, keyed by property name.
+    """
+    preamble = []
+    sections = {}
+    current = preamble
+    for line in markdown.splitlines(keepends=True):
+        match = SECTION_PATTERN.match(line)
+        if match and match.group(1) in names:
+            current = sections.setdefault(match.group(1), [])
+        current.append(line)
+    return preamble, sections
+
+def get_table_rows(lines):
+    """ Returns the stripped cells of each table row in lines, keyed by the anchor it links to. """
+    rows = {}
+    for line in lines:
+        if line.startswith('|') and (match := ROW_ANCHOR_PATTERN.search(line)):
+            rows[match.group(1)] = [cell.strip() for cell in line.strip().strip('|').split('|')]
+    return rows
+
+def get_autogenerated_range(lines):
+    """ Returns the first autogenerated heading number used in lines and how many there are. """
+    numbers = {int(number) for line in lines for number in AUTOGENERATED_PATTERN.findall(line)}
+    return (min(numbers) if numbers else None), len(numbers)
+
+def splice_sections(old_markdown, partial_markdown, names, affected):
+    """ Builds the generated markdown for a schema from the previous build's markdown and a render
+        in which only the affected properties are complete. Returns None if the result could
+        differ from a full render, in which case the caller should render everything.
+    """
+    old_preamble, old_sections = split_sections(old_markdown, names)
+    new_preamble, new_sections = split_sections(partial_markdown, names)
+    if list(old_sections) != list(names) or list(new_sections) != list(names):
+        return None
+
+    #the overview table comes from the partial render, so the stubs must reproduce unaffected rows
+    old_rows = get_table_rows(old_preamble)
+    new_rows = get_table_rows(new_preamble)
+    if any(old_rows.get(name) != new_rows.get(name) for name in names if name not in affected):
+        return None
+
+    spliced = list(new_preamble)
+    for name in names:
+        if name not in affected:
+            spliced.extend(old_sections[name])
+            continue
+
+        #autogenerated heading numbers run through the whole document; move them back into place
+        old_start, old_count = get_autogenerated_range(old_sections[name])
+        new_start, new_count = get_autogenerated_range(new_sections[name])
+        if old_count != new_count:
+            return None
+        offset = old_start - new_start if new_count else 0
+        spliced.extend(AUTOGENERATED_PATTERN.sub(lambda m: f"autogenerated_heading_{int(m.group(1)) + offset}", line) for line in new_sections[name])
+
+    return ''.join(spliced)
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+""" Lightweight build instrumentation shared by generate_markdown_schema.py and run_mkdocs.py.
+
+    A Profiler times named stages (wall and CPU time, and the peak RSS reached so far, which
+    is the process's high-water mark rather than what the stage itself used), keeps counters
+    such as the number of files parsed or lines skipped, can run one chosen stage under
+    cProfile, and writes everything to a JSON report that CI can keep to track build cost.
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import datetime
+import platform
+
+from contextlib import contextmanager
+
+#peak RSS comes from getrusage, which is not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def get_cpu_time():
+    """ Returns the CPU time used by this process and any child processes it has waited for. """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def get_peak_rss():
+    """ Returns the largest peak resident set size of this process, or of any child process it
+        has waited for (such as mkdocs), so far in MB, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    #macOS reports bytes, Linux reports kilobytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+class Profiler:
+    """ Records per-stage timings and counters for one run of a script. When disabled, stages
+        and counters cost next to nothing and nothing is reported. labels are added to every
+        stage recorded, e.g. to tell apart the same stage run for different documents.
+    """
+
+    def __init__(self, script, enabled=True, profile_stage=None, profile_dir=None, labels=None):
+        self.script = script
+        self.enabled = enabled
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.labels = labels or {}
+        self.stages = []
+        self.counters = {}
+        self.profiles = []
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._start_wall = time.perf_counter()
+        self._start_cpu = get_cpu_time()
+
+    @contextmanager
+    def stage(self, name):
+        """ Times the code in the with block as the stage name. """
+        if not self.enabled:
+            yield
+            return
+
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        start_wall = time.perf_counter()
+        start_cpu = get_cpu_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                self.dump_profile(name, profiler)
+            self.stages.append({**self.labels, 'name': name, 'wall_seconds': round(time.perf_counter() - start_wall, 6),
+                                'cpu_seconds': round(get_cpu_time() - start_cpu, 6), 'peak_rss_mb_so_far': get_peak_rss()})
+
+    def count(self, name, value=1):
+        """ Adds value to the counter name. """
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, report):
+        """ Adds the stages, counters and cProfile files of another profiler's report, such as one
+            made in a worker process.
+        """
+        if not self.enabled:
+            return
+        self.stages.extend(report['stages'])
+        for name, value in report['counters'].items():
+            self.count(name, value)
+        self.profiles.extend(report['profiles'])
+
+    def dump_profile(self, name, profiler):
+        """ Writes the cProfile statistics for a stage to <profile_dir>/<script>.<stage>.prof. """
+        os.makedirs(self.profile_dir or '.', exist_ok=True)
+        file_name = os.path.join(self.profile_dir or '.', f"{self.script}.{name}.prof")
+        profiler.dump_stats(file_name)
+        self.profiles.append(file_name)
+
+    def report(self):
+        """ Returns the recorded stages and counters as a dict ready to be saved as JSON. """
+        return {
+            'script': self.script,
+            'started': self.started.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'stages': self.stages,
+            'counters': self.counters,
+            'profiles': self.profiles,
+            'total': {'wall_seconds': round(time.perf_counter() - self._start_wall, 6),
+                      'cpu_seconds': round(get_cpu_time() - self._start_cpu, 6), 'peak_rss_mb_so_far': get_peak_rss()},
+        }
+
+    def print_summary(self):
+        """ Prints a table of the recorded stages followed by the counters. """
+        if not self.enabled:
+            return
+        report = self.report()
+        stages = report['stages'] + [dict(report['total'], name='total')]
+        labels = [' '.join([stage['name']] + [f"[{stage[key]}]" for key in stage if key not in ('name', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb_so_far')]) for stage in stages]
+        width = max(20, *map(len, labels))
+        print(f"\n{'Stage':<{width}} {'Wall (s)':>10} {'CPU (s)':>10} {'Peak RSS so far (MB)':>21}")
+        for label, stage in zip(labels, stages):
+            rss = f"{stage['peak_rss_mb_so_far']:21.1f}" if stage['peak_rss_mb_so_far'] is not None else f"{'n/a':>21}"
+            print(f"{label:<{width}} {stage['wall_seconds']:10.3f} {stage['cpu_seconds']:10.3f} {rss}")
+        for name, value in report['counters'].items():
+            print(f"\t{name}: {value}")
+        for file_name in report['profiles']:
+            print(f"\tcProfile stats saved to {file_name}")
+
+    def save(self, file_name):
+        """ Writes the report to file_name as JSON. """
+        if not self.enabled or not file_name:
+            return
+        if os.path.dirname(file_name):
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
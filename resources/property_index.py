@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+""" Builds an index of every documented property in a dereferenced schema, keyed by the anchor
+    name JSON Schema for Humans gives its heading and table row. Each entry holds the facts
+    the markdown post-processor needs (label, cleaned label, required, repeatable, type and
+    format), so they are read from the schema instead of being scraped from rendered tables.
+
+    Usage:
+        index = build_property_index(dereference_cache(load_cache(root_dir))[schema_id])
+        index['principal_investigator_items_name']['required']  # 'Yes'
+"""
+from functools import lru_cache
+
+#characters JSON Schema for Humans strips from anchor names
+ANCHOR_FORBIDDEN_CHARS = set('"\'\\#?&.$')
+
+@lru_cache(maxsize=1024)
+def clean_label(label):
+
+    return label.replace('_', ' ').title().replace("To", "to").replace("Of", "of").replace("Id", "ID").replace("Doi", "Digital Object Identifier (DOI)").replace("IDentifier", "Identifier").replace("Sda ", "SDA ")
+
+def get_anchor(parent_anchor, part):
+    """ Returns the anchor name of part below parent_anchor, escaped as JSON Schema for Humans does. """
+    anchor = f"{parent_anchor}_{part}" if parent_anchor else str(part)
+    anchor = ''.join(c for c in '_'.join(anchor.split()) if c not in ANCHOR_FORBIDDEN_CHARS).lstrip('_')
+    return anchor or '_'
+
+def get_enum_type(values):
+    """ Returns the type name of an enum, e.g. 'enum (of string)'. """
+    names = {str: 'string', int: 'integer', float: 'number', bool: 'boolean', list: 'array', dict: 'object', type(None): 'null'}
+    types = [names.get(python_type, 'string') for python_type in {type(value) for value in values}]
+    return f"enum (of {' or '.join(types)})" if types else 'enum'
+
+def get_type_name(prop):
+    """ Returns the type shown for prop in the overview tables, e.g. 'array of string'. """
+    if 'const' in prop:
+        return 'const'
+    if 'enum' in prop:
+        return get_enum_type(prop['enum'])
+    if 'type' not in prop:
+        return 'object'
+
+    type_names = prop['type'] if isinstance(prop['type'], list) else [prop['type']]
+    items = prop.get('items')
+    if 'array' in type_names and isinstance(items, dict):
+        subtype = get_enum_type(items['enum']) if 'enum' in items else items.get('type')
+        if subtype:
+            type_names = [f"array of {subtype}" if name == 'array' else name for name in type_names]
+    return ", ".join(type_names[:-1]) + (" or " if len(type_names) > 1 else "") + type_names[-1]
+
+def build_property_index(schema, index=None, parent_anchor=''):
+    """ Walks a dereferenced schema once and returns a dict with an entry for each property
+        (top-level or nested in objects and array items), keyed by its anchor name.
+    """
+    index = {} if index is None else index
+    required = schema.get('required', [])
+    for name, prop in schema.get('properties', {}).items():
+        if not isinstance(prop, dict):
+            continue
+        anchor = get_anchor(parent_anchor, name)
+        type_name = get_type_name(prop)
+        items = prop.get('items') if isinstance(prop.get('items'), dict) else {}
+        index[anchor] = {'label': name, 'cleaned_label': clean_label(name), 'required': 'Yes' if name in required else 'No',
+                         'repeatable': 'Yes' if type_name.startswith('array') else 'No', 'type': type_name, 'format': prop.get('format', items.get('format'))}
+        build_property_index(prop, index, anchor)
+
+    items = schema.get('items')
+    if isinstance(items, dict):
+        build_property_index(items, index, get_anchor(parent_anchor, 'items'))
+    return index
@@ -4,14 +4,112 @@ import subprocess
 import shutil
 import os
 import sys
+import logging
 import argparse
 
+from glob import glob
+
+from incremental_build import hash_file, hash_files, load_manifest, save_manifest
+from instrumentation import Profiler
+
+#stages that --profile-stage can run under cProfile
+PROFILE_STAGES = ('mkdocs_build', 'copy_css')
+
+logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+log = logging.getLogger()
+
 def get_cli_arguments():
     """ Parse command line arguments and return an object whose members contain the argument values. """
     parser = argparse.ArgumentParser(description="Generate markdown from JSON Schema and YAML files")
     parser.add_argument('--source-dir', dest='source_dir', type=str, help='Source directory', required=True)
+    parser.add_argument('--dirty', dest='dirty', action='store_true', help='Only re-render pages whose markdown changed since the last build, instead of a clean build')
+    parser.add_argument('--skip-unchanged', dest='skip_unchanged', action='store_true', help='Do nothing if the markdown, MkDocs configuration, theme and CSS are unchanged since the last build')
+    parser.add_argument('--external-mkdocs', dest='external_mkdocs', action='store_true', help='Run the mkdocs command instead of building in-process')
+    parser.add_argument('--profile', dest='profile', action='store_true', help='Record per-stage time and memory, print them and save them as a JSON report')
+    parser.add_argument('--profile-report', dest='profile_report', type=str, help='Where to save the JSON report (default: .cache/profile/run_mkdocs.json); implies --profile')
+    parser.add_argument('--profile-stage', dest='profile_stage', choices=PROFILE_STAGES, help='Also run this stage under cProfile, saving the stats next to the report; implies --profile')
     return parser.parse_args()
 
+def build_pages(mkdocs_yml, dirty=False):
+    """ Builds the site configured in mkdocs_yml in-process with the MkDocs API and returns the
+        markdown pages that were rendered. A dirty build keeps the existing site and only
+        re-renders pages whose markdown is newer than their HTML; as with mkdocs build --dirty,
+        navigation in unchanged pages is not updated.
+    """
+    from mkdocs.commands.build import build
+    from mkdocs.config import load_config
+    from mkdocs.structure.files import get_files
+
+    config = load_config(config_file=mkdocs_yml)
+    pages = [page.src_path for page in get_files(config).documentation_pages() if not dirty or page.is_modified()]
+    build(config, dirty=dirty)
+    return pages
+
+def copy_if_changed(source, destination):
+    """ Copies source to destination unless destination already has the same content. Returns True if it copied. """
+    if hash_file(source) == hash_file(destination):
+        return False
+    shutil.copy(source, destination)
+    return True
+
+def get_site_inputs(source_dir):
+    """ Returns the files the HTML site is built from: the markdown pages and their assets, the
+        MkDocs configuration, the custom theme and the improved CSS. Hidden files are not part
+        of the site.
+    """
+    resource_dir = os.path.join(source_dir, 'resources')
+    file_names = glob(os.path.join(source_dir, 'markdown', '**', '*'), recursive=True) + glob(os.path.join(resource_dir, 'custom_theme', '**', '*'), recursive=True)
+    file_names += [os.path.join(resource_dir, name) for name in ('mkdocs.yml', 'readthedocs_theme.css', 'readthedocs_theme_extra.css')]
+    return [file_name for file_name in file_names if os.path.isfile(file_name)]
+
+def build_site(source_dir, profiler=None, dirty=False, external=False, skip_unchanged=False):
+    """ Builds the HTML documentation site for the project in source_dir, in-process unless
+        external is set. With dirty, only changed pages are re-rendered; with skip_unchanged,
+        nothing is built if no input has changed since the last build. Returns the pages
+        rendered, or None if the mkdocs command did the build. Stages and counts are recorded
+        in profiler (an instrumentation.Profiler), if given.
+    """
+    #set up variables
+    site_dir = os.path.join(source_dir, 'site')
+    resource_dir = os.path.join(source_dir, 'resources')
+    mkdocs_yml = os.path.join(resource_dir, 'mkdocs.yml')
+    rtd_css = os.path.join(resource_dir, 'readthedocs_theme.css')
+    rtd_extra_css = os.path.join(resource_dir, 'readthedocs_theme_extra.css')
+    manifest_file = os.path.join(source_dir, '.cache', 'site.manifest.json')
+    profiler = profiler or Profiler('run_mkdocs', enabled=False)
+
+    #an unchanged site need not be rebuilt, or deployed again
+    input_hashes = hash_files(source_dir, get_site_inputs(source_dir))
+    if skip_unchanged and os.path.exists(os.path.join(site_dir, 'index.html')) and load_manifest(manifest_file).get('inputs') == input_hashes:
+        print("\tNo markdown, configuration or theme changes since the last site build; nothing to do")
+        return []
+
+    if not os.path.exists(site_dir):
+        os.makedirs(site_dir)
+
+    #generate html; run mkdocs
+    profiler.count('markdown_pages', len(glob(os.path.join(source_dir, 'markdown', '**', '*.md'), recursive=True)))
+    with profiler.stage('mkdocs_build'):
+        if external:
+            cmd = 'mkdocs build -f {} {} --verbose'.format(mkdocs_yml, '--dirty' if dirty else '--clean')
+            subprocess.run(cmd, shell=True, check=True)
+            pages = None
+        else:
+            pages = build_pages(mkdocs_yml, dirty)
+
+    if pages is not None:
+        print(f"\tRendered {len(pages)} page(s){': ' + ', '.join(pages) if pages else ''}")
+        profiler.count('pages_rendered', len(pages))
+
+    #add improved CSS; a dirty build leaves the copies from the last build in place
+    with profiler.stage('copy_css'):
+        copied = copy_if_changed(rtd_css, os.path.join(site_dir, 'css', 'theme.css'))
+        copied += copy_if_changed(rtd_extra_css, os.path.join(site_dir, 'css', 'theme_extra.css'))
+    profiler.count('css_files_copied', copied)
+
+    save_manifest(manifest_file, {'inputs': input_hashes})
+    return pages
+
 def main():
     try:
         args = get_cli_arguments()
@@ -20,26 +118,18 @@ def main():
             print(f"{args.source_dir} does not exist. Please verify path and try again")
             sys.exit(1)
 
-        #set up variables
-        site_dir = os.path.join(args.source_dir, 'site')
-        resource_dir = os.path.join(args.source_dir, 'resources')
-        mkdocs_yml = os.path.join(resource_dir, 'mkdocs.yml')
-        rtd_css = os.path.join(resource_dir, 'readthedocs_theme.css')
-        rtd_extra_css = os.path.join(resource_dir, 'readthedocs_theme_extra.css')
-        
-        if not os.path.exists(site_dir):
-            os.makedirs(site_dir)
-
-        #generate html; run mkdocs
-        cmd = 'mkdocs build -f {} --clean --verbose'.format(mkdocs_yml)
-        subprocess.run(cmd, shell=True)
+        if args.profile_report or args.profile_stage:
+            args.profile = True
+        profile_report = args.profile_report or os.path.join(args.source_dir, '.cache', 'profile', 'run_mkdocs.json')
+        profiler = Profiler('run_mkdocs', args.profile, args.profile_stage, os.path.dirname(os.path.abspath(profile_report)))
 
-        #add improved CSS
-        shutil.copy(rtd_css, os.path.join(site_dir, 'css', 'theme.css'))
-        shutil.copy(rtd_extra_css, os.path.join(site_dir, 'css', 'theme_extra.css'))
+        build_site(args.source_dir, profiler, args.dirty, args.external_mkdocs, args.skip_unchanged)
+        profiler.print_summary()
+        profiler.save(profile_report)
 
     except Exception as ex: # pylint: disable=broad-except
+        log.error(ex)
         sys.exit(1)
 
 if __name__=='__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+""" Validates study metadata records against a dereferenced schema. The schema files are loaded
+    and dereferenced as for the documentation, compiled once into a validator, and records are
+    streamed from JSONL/NDJSON files (or standard input) and validated in batches across a pool
+    of worker processes, so memory stays bounded however many records there are.
+
+    Besides the JSON Schema keywords, a string property whose controlledVocab lists its terms
+    in a table only accepts those terms, and the date and uri formats are checked.
+
+    Usage:
+        python validate_records.py --source-dir .. records.jsonl > errors.jsonl
+        cat records.jsonl | python validate_records.py --source-dir .. --schema icpsr_study_schema_v1 -
+
+    Each invalid record is written as one JSON line giving its file, line number and errors;
+    the exit status is 1 if any record is invalid.
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import itertools
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+import generate_markdown_schema as gms
+
+#jsonschema is only needed to validate records, not to build the documentation
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+#the schema validated against when the source directory has several top-level schemas
+DEFAULT_SCHEMA = 'icpsr_study_schema'
+
+#seconds between progress messages while validating
+PROGRESS_INTERVAL = 10
+
+logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+log = logging.getLogger()
+
+#the validator each worker process compiles once, in init_worker
+_validator = None
+
+def get_cli_arguments(argv=None):
+    """ Parse command line arguments (or argv, if given) and return an object whose members contain the argument values. """
+    parser = argparse.ArgumentParser(description="Validate study metadata records in JSONL/NDJSON files against the dereferenced schema")
+    parser.add_argument('files', nargs='*', default=['-'], help="JSONL/NDJSON files with one record per line; '-' (the default) reads standard input")
+    parser.add_argument('--source-dir', dest='source_dir', type=str, help='Source directory', required=True)
+    parser.add_argument('--schema', dest='schema', type=str, help=f"Document name (e.g. icpsr_study_schema_v1) or $id of the schema to validate against (default: {DEFAULT_SCHEMA})")
+    parser.add_argument('--workers', dest='workers', type=int, default=None, help='Number of worker processes (default: one per CPU)')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000, help='Number of records sent to a worker at a time')
+    parser.add_argument('--max-errors', dest='max_errors', type=int, default=20, help='Largest number of errors reported for one record')
+    parser.add_argument('--output', dest='output', type=str, help='Write the errors to this file instead of standard output')
+    return parser.parse_args(argv)
+
+def load_schema(root_dir, name=None):
+    """ Loads and dereferences the schema files in root_dir and returns the top-level schema
+        called name, which is a document name (as given by get_document_names) or an $id.
+    """
+    #the docs build's parse cache is not used, so validation never writes to root_dir
+    cache = gms.dereference_cache(gms.load_cache(root_dir), share=True)
+    names = gms.get_document_names(cache)
+    if name is None:
+        name = next(iter(names.values())) if len(names) == 1 else DEFAULT_SCHEMA
+
+    for key, document_name in names.items():
+        if name in (key, document_name):
+            return cache[key]
+    raise ValueError(f"There is no top-level schema called {name}; choose one of: {', '.join(sorted(names.values()))}")
+
+def get_vocabulary_terms(controlled_vocab):
+    """ Returns the terms in the first column of the table in a controlledVocab annotation, or
+        None if it has no table (e.g. it is N/A or names an external authority list).
+    """
+    terms = []
+    rows = [line.strip() for line in controlled_vocab.splitlines() if line.strip().startswith('|')]
+    #the first row is the heading and the second separates it from the terms
+    for row in rows[2:]:
+        if term := row.strip('|').split('|')[0].strip():
+            terms.append(term)
+    return terms or None
+
+def apply_controlled_vocabularies(schema):
+    """ Returns a copy of schema in which every property whose controlledVocab lists its terms,
+        but which has no enum of its own, only accepts those terms (in each of its items, if it
+        is an array). The copy can be compiled without changing a shared dereferenced schema.
+    """
+    if isinstance(schema, list):
+        return [apply_controlled_vocabularies(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    new = {key: apply_controlled_vocabularies(value) for key, value in schema.items()}
+    if isinstance(schema.get('controlledVocab'), str) and (terms := get_vocabulary_terms(schema['controlledVocab'])):
+        target = new['items'] if new.get('type') == 'array' and isinstance(new.get('items'), dict) else new
+        if 'enum' not in target and 'const' not in target:
+            target['enum'] = terms
+    return new
+
+def is_uri(value):
+    """ Returns False if value is a string but not an absolute URI; other types are left to the type check. """
+    if not isinstance(value, str):
+        return True
+    url = urlparse(value)
+    return bool(url.scheme and (url.netloc or url.path)) and not any(c.isspace() for c in value)
+
+def get_format_checker():
+    """ Returns a FormatChecker for the formats the schemas use. jsonschema only checks uri
+        when rfc3987 is installed, so is_uri stands in for it otherwise.
+    """
+    checker = jsonschema.FormatChecker()
+    if 'uri' not in checker.checkers:
+        checker.checks('uri')(is_uri)
+    return checker
+
+def get_validator_class(schema):
+    """ Returns the jsonschema validator class for the draft schema declares in $schema. The
+        schema files declare draft-07 with an https:// URI, which jsonschema knows as http://.
+    """
+    meta_schema = {'$schema': re.sub(r'^https://json-schema\.org/draft-0', 'http://json-schema.org/draft-0', schema['$schema'])} if '$schema' in schema else {}
+    return jsonschema.validators.validator_for(meta_schema, default=jsonschema.Draft7Validator)
+
+def compile_validator(schema):
+    """ Checks a dereferenced schema, applies its controlled vocabularies and returns a
+        validator for it that can be reused for any number of records.
+    """
+    if jsonschema is None:
+        raise ImportError("Validating records requires jsonschema; install it with pip install -r resources/requirements.txt")
+    schema = apply_controlled_vocabularies(schema)
+    validator_class = get_validator_class(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema, format_checker=get_format_checker())
+
+def init_worker(schema):
+    """ Compiles the validator once in each worker process. """
+    global _validator # pylint: disable=global-statement
+    _validator = compile_validator(schema)
+
+def validate_record(validator, text, max_errors):
+    """ Returns up to max_errors errors for one line of JSONL, each a dict with the JSON path
+        of the offending value and a message. A valid record has no errors.
+    """
+    try:
+        record = json.loads(text)
+    except ValueError as ex:
+        return [{'path': '$', 'message': f"Not valid JSON: {ex}"}]
+    return [{'path': error.json_path, 'message': error.message} for error in itertools.islice(validator.iter_errors(record), max_errors)]
+
+def validate_batch(batch, max_errors, validator=None):
+    """ Validates a batch of (file name, line number, text) records with validator, or with the
+        worker's validator. Returns the number of records and a list of the invalid ones.
+    """
+    validator = validator or _validator
+    failures = []
+    for file_name, line_number, text in batch:
+        if errors := validate_record(validator, text, max_errors):
+            failures.append({'file': file_name, 'line': line_number, 'errors': errors})
+    return len(batch), failures
+
+def read_records(file_names):
+    """ Yields (file name, line number, text) for each non-blank line of the JSONL files,
+        reading standard input for '-'. Lines are read as they are needed.
+    """
+    for file_name in file_names:
+        fi = sys.stdin if file_name == '-' else open(file_name, 'r', encoding='utf-8')
+        try:
+            for line_number, line in enumerate(fi, 1):
+                if line.strip():
+                    yield '<stdin>' if file_name == '-' else file_name, line_number, line
+        finally:
+            if fi is not sys.stdin:
+                fi.close()
+
+def get_batches(records, batch_size):
+    """ Yields lists of up to batch_size records. """
+    records = iter(records)
+    while batch := list(itertools.islice(records, batch_size)):
+        yield batch
+
+def validate_stream(schema, records, workers=None, batch_size=1000, max_errors=20):
+    """ Validates records ((file name, line number, text) tuples) against schema, yielding the
+        result of validate_batch for each batch in input order. The schema is compiled once;
+        unless there is only one worker or one batch, batches are validated in a process pool
+        with at most two per worker in flight, so only those are held in memory at a time.
+    """
+    validator = compile_validator(schema)
+    workers = workers or os.cpu_count() or 1
+    batches = get_batches(records, batch_size)
+    first = next(batches, [])
+
+    if workers == 1 or len(first) < batch_size:
+        for batch in itertools.chain([first], batches):
+            yield validate_batch(batch, max_errors, validator)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(schema,)) as executor:
+        pending = deque()
+        for batch in itertools.chain([first], batches):
+            pending.append(executor.submit(validate_batch, batch, max_errors))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def main():
+    try:
+        args = get_cli_arguments()
+
+        if not os.path.exists(args.source_dir):
+            print(f"{args.source_dir} does not exist. Please verify path and try again")
+            sys.exit(1)
+
+        schema = load_schema(args.source_dir, args.schema)
+        records = invalid = 0
+        start = last_progress = time.perf_counter()
+        fo = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            for count, failures in validate_stream(schema, read_records(args.files), args.workers, args.batch_size, args.max_errors):
+                records += count
+                invalid += len(failures)
+                for failure in failures:
+                    fo.write(json.dumps(failure) + '\n')
+                if time.perf_counter() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.perf_counter()
+                    log.info(f"Validated {records} records ({records / (last_progress - start):,.0f} records/s)")
+        finally:
+            if fo is not sys.stdout:
+                fo.close()
+
+        elapsed = time.perf_counter() - start
+        log.info(f"Validated {records} record(s) in {elapsed:.2f}s ({records / elapsed if elapsed else 0:,.0f} records/s): {records - invalid} valid, {invalid} invalid")
+        if invalid:
+            sys.exit(1)
+
+    except Exception as ex: # pylint: disable=broad-except
+        log.error(ex)
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()